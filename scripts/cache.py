@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tiny on-disk response cache for Ollama calls (sqlite3, exact match).
+
+Entries are keyed by blake2b(model + system + prompt + options); a hit
+returns the stored response and skips the model inference entirely. Long
+auto-chained runs revisit near-identical Questioner/Scriber inputs often
+enough for this to pay for itself.
+
+Connections are thread-local so callers may use the cache from worker
+threads without sharing a sqlite handle.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+
+CACHE_PATH = os.getenv(
+    "METAFORMERS_CACHE",
+    os.path.join(os.path.expanduser("~"), ".cache", "metaformers", "responses.db"),
+)
+
+_local = threading.local()
+
+def _conn() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(CACHE_PATH), exist_ok=True)
+        conn = sqlite3.connect(CACHE_PATH)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses (key BLOB PRIMARY KEY, response TEXT)"
+        )
+        conn.commit()
+        _local.conn = conn
+    return conn
+
+def make_key(model: str, prompt: str, system: str = "", options: dict = None) -> bytes:
+    blob = "\x00".join(
+        (model, system or "", prompt, json.dumps(options or {}, sort_keys=True))
+    )
+    return hashlib.blake2b(blob.encode("utf-8", "ignore"), digest_size=32).digest()
+
+def get(key: bytes):
+    """Return the cached response text, or None on a miss."""
+    try:
+        row = _conn().execute(
+            "SELECT response FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        return row[0] if row else None
+    except sqlite3.Error:
+        return None
+
+def put(key: bytes, response: str) -> None:
+    try:
+        conn = _conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO responses (key, response) VALUES (?, ?)",
+            (key, response),
+        )
+        conn.commit()
+    except sqlite3.Error:
+        pass
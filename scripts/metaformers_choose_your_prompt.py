@@ -30,12 +30,16 @@ Notes
 
 from __future__ import annotations
 
+import atexit
 import os
+import pty
+import select
 import sys
 import json
 import time
 import re
 import subprocess
+import termios
 from datetime import datetime
 from pathlib import Path
 from typing import Tuple, Optional
@@ -49,12 +53,23 @@ MEDIATOR   = os.environ.get("AI_MEDIATOR",   "dolphin3:latest")
 OLLAMA_BIN = os.environ.get("OLLAMA_BIN", "/usr/local/bin/ollama")
 MEDIATOR_EVERY = int(os.environ.get("MEDIATOR_EVERY", "3"))
 
+# Child environment for ollama is invariant across calls; build it once.
+_OLLAMA_ENV = {
+    **os.environ,
+    "TERM": "dumb",
+    "NO_COLOR": "1",
+    "CLICOLOR": "0",
+    "PYTHONUNBUFFERED": "1",
+    "COLORTERM": "0",
+    "OLLAMA_SHELL": "0",
+}
+
 # ------------- ANSI handling -------------
 
 # CSI (e.g., \x1b[?25l), OSC (e.g., \x1b]8;;…\x07), and single-char C1 codes
-_ANSI_CSI = re.compile(r"\x1b\[[0-?]*[ -/]*[@-~]")
-_ANSI_OSC = re.compile(r"\x1b\][^\x07]*\x07")
-_ANSI_C1  = re.compile(r"\x1b[@-Z\\-_]")  # 0x40–0x5F range
+# fused into one alternation so stripping is a single pass.
+# OSC first (longest prefix, ends in BEL), then CSI, then bare C1.
+_ANSI_ANY = re.compile(r"\x1b\][^\x07]*\x07|\x1b\[[0-?]*[ -/]*[@-~]|\x1b[@-Z\\-_]")
 _BACKSPACE_OVERSTRIKE = re.compile(r".\x08")  # remove overstruck chars
 
 # Common braille spinner frames and similar glyphs; drop long runs so they don't leak into prompts/logs
@@ -62,6 +77,8 @@ _SPIN_CHARS = "⠁⠂⠄⠆⠇⠋⠙⠚⠛⠟⠿⠷⠧⠦⠴⠼⠸⠹⠏"
 # Match runs of braille spinner glyphs (U+2800–U+28FF). We allow optional spaces between frames.
 # Using 2+ to aggressively drop sequences even if the model prints only a couple frames.
 _SPINNER_BLOCK_RE = re.compile(r'(?:[\u2800-\u28FF]\s*){2,}')
+# Cheap probe for "does this chunk contain braille at all" (fast-path gate).
+_BRAILLE_PROBE_RE = re.compile(r'[\u2800-\u28FF]')
 
 def strip_spinners(s: str) -> str:
     # Remove braille runs anywhere
@@ -90,10 +107,19 @@ def _split_complete_ansi_window(s: str) -> tuple[str, str]:
     if last == -1:
         return s, ""
     tail = s[last:]
-    # If tail is a full escape sequence, keep everything in head
-    if _ANSI_CSI.fullmatch(tail) or _ANSI_OSC.fullmatch(tail) or _ANSI_C1.fullmatch(tail):
+    if len(tail) == 1:
+        # bare ESC — wait for more bytes
+        return s[:last], tail
+    # ANSI sequences end on well-known bytes, so check the terminator
+    # directly instead of running three regex fullmatches per chunk.
+    b = tail[1]
+    if b == "[":  # CSI terminates on a final byte in 0x40–0x7E
+        return (s, "") if len(tail) > 2 and "@" <= tail[-1] <= "~" else (s[:last], tail)
+    if b == "]":  # OSC terminates on BEL
+        return (s, "") if tail.endswith("\x07") else (s[:last], tail)
+    if "@" <= b <= "_":  # single-byte C1 — already complete
         return s, ""
-    # Otherwise, cut the tail so we can prepend it to the next chunk
+    # Unknown escape; cut the tail so we can prepend it to the next chunk
     return s[:last], tail
 
 def strip_ansi(s: str) -> str:
@@ -105,9 +131,8 @@ def strip_ansi(s: str) -> str:
         if new == s:
             break
         s = new
-    s = _ANSI_OSC.sub("", s)
-    s = _ANSI_CSI.sub("", s)
-    s = _ANSI_C1.sub("", s)
+    if "\x1b" in s:
+        s = _ANSI_ANY.sub("", s)
     return s
 
 # ------------- Topic & plan guards -------------
@@ -174,8 +199,15 @@ def looks_like_plan(s: str) -> bool:
 def ts() -> str:
     return datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
 
+_MKDIR_CACHE: set = set()
+
 def mkdirp(p: Path) -> None:
+    # Memoize so the per-chunk append_text calls don't pay a stat+mkdir each.
+    key = str(p)
+    if key in _MKDIR_CACHE:
+        return
     p.mkdir(parents=True, exist_ok=True)
+    _MKDIR_CACHE.add(key)
 
 def write_text(path: Path, data: str) -> None:
     mkdirp(path.parent)
@@ -190,37 +222,208 @@ def say(line: str) -> None:
     sys.stdout.write(line + "\n")
     sys.stdout.flush()
 
+# ------------- Persistent Ollama REPL (one proc per model) -------------
+#
+# Spawning `ollama run <model>` per turn pays a fork/exec + model-load probe
+# on every call. The CLI keeps the model resident when run interactively, so
+# we hold one long-lived REPL per model and feed successive prompts to it.
+# `ollama run` only enters REPL mode when stdin is a TTY, hence the pty.
+# Set MF_PERSISTENT=0 to force the old one-shot spawn per call.
+
+_USE_REPL = os.environ.get("MF_PERSISTENT", "1") != "0"
+_REPL_SENTINEL = ">>> "
+# Hard cap per reply: the resident child never exits on its own, so a stalled
+# server (or a CLI that changed its prompt string) must not hang the loop.
+_REPL_REPLY_TIMEOUT = float(os.environ.get("MF_REPL_TIMEOUT", "600"))
+_REPL_PROCS: dict = {}  # model -> (Popen, master fd)
+
+def _spawn_repl(model: str):
+    master, slave = pty.openpty()
+    # Turn off kernel echo so our own prompt bytes don't come back at us.
+    attrs = termios.tcgetattr(slave)
+    attrs[3] &= ~termios.ECHO
+    termios.tcsetattr(slave, termios.TCSANOW, attrs)
+    proc = subprocess.Popen(
+        [OLLAMA_BIN, "run", model],
+        stdin=slave,
+        stdout=slave,
+        stderr=slave,
+        env=_OLLAMA_ENV,
+        bufsize=0,
+        close_fds=True,
+    )
+    os.close(slave)
+    # Consume the banner + first ">>> " prompt so replies start clean.
+    _drain_to_sentinel(proc, master, timeout=60.0)
+    return proc, master
+
+def _drain_to_sentinel(proc, master: int, timeout: float) -> None:
+    buf = ""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline and proc.poll() is None:
+        r, _, _ = select.select([master], [], [], 0.25)
+        if not r:
+            continue
+        try:
+            chunk = os.read(master, 4096)
+        except OSError:
+            return
+        if not chunk:
+            return
+        buf += sanitize_chunk(chunk.decode("utf-8", errors="ignore"))
+        if buf.rstrip().endswith(">>>"):
+            return
+
+def _get_repl(model: str):
+    entry = _REPL_PROCS.get(model)
+    if entry is None or entry[0].poll() is not None:
+        entry = _spawn_repl(model)
+        _REPL_PROCS[model] = entry
+    return entry
+
+def _kill_repl(model: str) -> None:
+    entry = _REPL_PROCS.pop(model, None)
+    if entry is None:
+        return
+    proc, master = entry
+    try:
+        os.close(master)
+    except OSError:
+        pass
+    try:
+        proc.terminate()
+    except OSError:
+        pass
+
+def _close_repls() -> None:
+    for model in list(_REPL_PROCS):
+        _kill_repl(model)
+
+atexit.register(_close_repls)
+
+def _run_ollama_repl(model: str, prompt: str, log_file: Path, *, log_raw: bool = False, raw_log_file: Optional[Path] = None) -> str:
+    """Send one prompt to the model's resident REPL and stream the reply."""
+    proc, master = _get_repl(model)
+
+    mkdirp(log_file.parent)
+    if log_raw and raw_log_file:
+        mkdirp(raw_log_file.parent)
+
+    say(f"[{ts()}] [{model}] <<<")
+    append_text(log_file, f"\n[{ts()}] PROMPT:\n{sanitize_block(prompt)}\n\n[{ts()}] OUTPUT:\n")
+    if log_raw and raw_log_file:
+        append_text(raw_log_file, f"\n[{ts()}] PROMPT:\n{prompt}\n\n[{ts()}] RAW_OUT:\n")
+
+    # Triple-quote so the REPL takes the multi-line prompt as ONE submission.
+    payload = '"""' + prompt.replace('"""', "'''") + '"""\n'
+    os.write(master, payload.encode("utf-8", errors="ignore"))
+
+    carry = ""
+    pending = ""  # cleaned text held back until we know it isn't the sentinel
+    final_buf = bytearray()
+    holdback = len(_REPL_SENTINEL) - 1
+    deadline = time.monotonic() + _REPL_REPLY_TIMEOUT
+    done = False
+    while not done and proc.poll() is None:
+        if time.monotonic() >= deadline:
+            # The REPL never exits on its own, so without this cap a missing
+            # sentinel would block forever.  TimeoutError is an OSError, so
+            # run_ollama falls back to a fresh one-shot spawn.
+            _kill_repl(model)
+            raise TimeoutError(f"{model} REPL reply exceeded {_REPL_REPLY_TIMEOUT:.0f}s")
+        r, _, _ = select.select([master], [], [], 0.25)
+        if not r:
+            continue
+        chunk = os.read(master, 4096)
+        if not chunk:
+            break
+        raw = chunk.decode("utf-8", errors="ignore")
+        if log_raw and raw_log_file:
+            append_text(raw_log_file, raw)
+        combined = carry + raw
+        head, carry = _split_complete_ansi_window(combined)
+        pending += sanitize_chunk(head)
+        idx = pending.find(_REPL_SENTINEL)
+        if idx != -1:
+            pending = pending[:idx]
+            done = True
+        elif len(pending) > holdback:
+            out, pending = pending[:-holdback], pending[-holdback:]
+            if out:
+                sys.stdout.write(out)
+                sys.stdout.flush()
+                append_text(log_file, out)
+                final_buf += out.encode("utf-8")
+    if pending:
+        sys.stdout.write(pending)
+        sys.stdout.flush()
+        append_text(log_file, pending)
+        final_buf += pending.encode("utf-8")
+
+    if not done:
+        # Child died mid-reply; let the caller fall back to a one-shot spawn.
+        _kill_repl(model)
+        raise OSError(f"{model} REPL ended before completing the reply")
+
+    # A reply can legitimately contain the sentinel string; whatever follows
+    # it is still in the pty and would pollute the next turn's read.  Drain
+    # until the fd goes idle before handing the REPL back.
+    while proc.poll() is None:
+        r, _, _ = select.select([master], [], [], 0.2)
+        if not r:
+            break
+        try:
+            leftover = os.read(master, 4096)
+        except OSError:
+            break
+        if not leftover:
+            break
+        if log_raw and raw_log_file:
+            append_text(raw_log_file, leftover.decode("utf-8", errors="ignore"))
+
+    if final_buf and not final_buf.endswith(b"\n"):
+        say("")
+        append_text(log_file, "\n")
+        if log_raw and raw_log_file:
+            append_text(raw_log_file, "\n")
+
+    return final_buf.decode("utf-8", errors="ignore").strip()
+
 # ------------- Ollama runner (streaming) -------------
 
 def run_ollama(model: str, prompt: str, log_file: Path, *, log_raw: bool = False, raw_log_file: Optional[Path] = None) -> str:
     """
-    Run `ollama run <model>` with the given prompt.
+    Run the prompt against <model>, reusing a persistent REPL when possible.
     Streams output; prints ANSI-stripped to console; writes ANSI-stripped text to `log_file`.
     If log_raw=True and raw_log_file is provided, also mirrors raw bytes to that file.
     Returns the full ANSI-stripped text.
     """
-    env = os.environ.copy()
-    env.update({
-        "TERM": "dumb",
-        "NO_COLOR": "1",
-        "CLICOLOR": "0",
-        "PYTHONUNBUFFERED": "1",
-        "COLORTERM": "0",
-        "OLLAMA_SHELL": "0",
-    })
-
+    if _USE_REPL:
+        try:
+            return _run_ollama_repl(model, prompt, log_file, log_raw=log_raw, raw_log_file=raw_log_file)
+        except (OSError, BrokenPipeError):
+            _kill_repl(model)
+            # fall through to a fresh one-shot invocation
+    return _run_ollama_oneshot(model, prompt, log_file, log_raw=log_raw, raw_log_file=raw_log_file)
+
+def _run_ollama_oneshot(model: str, prompt: str, log_file: Path, *, log_raw: bool = False, raw_log_file: Optional[Path] = None) -> str:
+    """
+    Run `ollama run <model>` once with the given prompt (fresh process per call).
+    """
     mkdirp(log_file.parent)
     if log_raw and raw_log_file:
         mkdirp(raw_log_file.parent)
 
-    full_clean_parts = []
+    # Accumulate the return value as UTF-8 bytes; every clean chunk is already
+    # streamed to stdout + log, so a parallel list of str would double peak memory.
+    final_buf = bytearray()
 
     proc = subprocess.Popen(
         [OLLAMA_BIN, "run", model],
         stdin=subprocess.PIPE,
         stdout=subprocess.PIPE,
         stderr=subprocess.STDOUT,
-        env=env,
+        env=_OLLAMA_ENV,
         bufsize=0,
     )
 
@@ -239,21 +442,31 @@ def run_ollama(model: str, prompt: str, log_file: Path, *, log_raw: bool = False
 
     # Stream stdout
     carry = ""
+    saw_esc = False
     while True:
         chunk = proc.stdout.read(4096)
         if not chunk:
             break
         raw = chunk.decode("utf-8", errors="ignore")
-        # Prepend any carried, possibly-incomplete escape sequence
-        combined = carry + raw
-        head, carry = _split_complete_ansi_window(combined)
-        clean = sanitize_chunk(head)
+        # Fast path: with TERM=dumb/NO_COLOR the child normally emits no ANSI
+        # at all, so skip the carry/split/strip machinery until an escape or
+        # overstrike byte actually shows up in the stream.
+        if not saw_esc and "\x1b" not in raw and "\x9b" not in raw and "\x08" not in raw:
+            clean = raw.replace("\r", "")
+            if _BRAILLE_PROBE_RE.search(clean):
+                clean = strip_spinners(clean)
+        else:
+            saw_esc = True
+            # Prepend any carried, possibly-incomplete escape sequence
+            combined = carry + raw
+            head, carry = _split_complete_ansi_window(combined)
+            clean = sanitize_chunk(head)
 
         if clean:
             sys.stdout.write(clean)
             sys.stdout.flush()
             append_text(log_file, clean)
-            full_clean_parts.append(clean)
+            final_buf += clean.encode("utf-8")
         if log_raw and raw_log_file and raw:
             append_text(raw_log_file, raw)
 
@@ -264,15 +477,14 @@ def run_ollama(model: str, prompt: str, log_file: Path, *, log_raw: bool = False
             sys.stdout.write(clean_tail)
             sys.stdout.flush()
             append_text(log_file, clean_tail)
-            full_clean_parts.append(clean_tail)
+            final_buf += clean_tail.encode("utf-8")
         if log_raw and raw_log_file:
             append_text(raw_log_file, carry)
 
     rc = proc.wait()
 
     # Ensure newline termination in console and log
-    final_text = "".join(full_clean_parts)
-    if final_text and not final_text.endswith("\n"):
+    if final_buf and not final_buf.endswith(b"\n"):
         say("")
         append_text(log_file, "\n")
         if log_raw and raw_log_file:
@@ -285,48 +497,55 @@ def run_ollama(model: str, prompt: str, log_file: Path, *, log_raw: bool = False
         if log_raw and raw_log_file:
             append_text(raw_log_file, warn_line + "\n")
 
-    return final_text.strip()
+    return final_buf.decode("utf-8", errors="ignore").strip()
 
 # ------------- Prompt templates -------------
+# The static scaffolding around each prompt never changes, so render it once at
+# import and build each prompt with a single PREFIX + dynamic + SUFFIX concat.
+
+_QUESTIONER_PREFIX = (
+    "TASK: You will receive ONE line of text between <q> and </q>.\n"
+    "GOAL: Output the SAME line, correcting ONLY obvious typos/spelling.\n"
+    "RULES: Do not rephrase, change word order, or add/remove words. No comments.\n"
+    "FORMAT: Return ONLY the corrected line wrapped in <out> and </out> — nothing else.\n"
+    "<q>\n"
+)
+_QUESTIONER_SUFFIX = "\n</q>\n"
+
+_CREATOR_PREFIX = (
+    "You are the Creator.\n"
+    "Given the Questioner's topic, propose a concrete, actionable mini‑plan in this EXACT format:\n\n"
+    "## Conceptual Insight\n"
+    "(2–4 sentences)\n\n"
+    "## Practical Mechanism\n"
+    "1. Step ...\n"
+    "2. Step ...\n"
+    "3. Step ...\n"
+    "4. Step ...\n\n"
+    "## Why This Matters\n"
+    "- Bullet\n"
+    "- Bullet\n"
+    "- Bullet\n\n"
+    "Topic:\n"
+)
+
+_MEDIATOR_PREFIX = (
+    "You are the Mediator. Read the Creator’s output below and challenge the core assumption with ONE incisive meta‑question "
+    "(<=80 words) that either (a) reveals a flaw, or (b) suggests a sharper objective. End with a question mark.\n\n"
+    "Creator output:\n"
+)
 
 def make_questioner_prompt(seed: str, last_creator_take: Optional[str]) -> str:
     """Prompt for Questioner to output only the corrected question between <out> tags."""
-    return (
-        "TASK: You will receive ONE line of text between <q> and </q>.\n"
-        "GOAL: Output the SAME line, correcting ONLY obvious typos/spelling.\n"
-        "RULES: Do not rephrase, change word order, or add/remove words. No comments.\n"
-        "FORMAT: Return ONLY the corrected line wrapped in <out> and </out> — nothing else.\n"
-        "<q>\n"
-        f"{seed}\n"
-        "</q>\n"
-    )
+    return _QUESTIONER_PREFIX + seed + _QUESTIONER_SUFFIX
 
 def make_creator_prompt(topic: str) -> str:
     """Prompt for Creator to propose actionable steps."""
-    return (
-        "You are the Creator.\n"
-        "Given the Questioner's topic, propose a concrete, actionable mini‑plan in this EXACT format:\n\n"
-        "## Conceptual Insight\n"
-        "(2–4 sentences)\n\n"
-        "## Practical Mechanism\n"
-        "1. Step ...\n"
-        "2. Step ...\n"
-        "3. Step ...\n"
-        "4. Step ...\n\n"
-        "## Why This Matters\n"
-        "- Bullet\n"
-        "- Bullet\n"
-        "- Bullet\n\n"
-        f"Topic:\n{topic}\n"
-    )
+    return _CREATOR_PREFIX + topic + "\n"
 
 def make_mediator_prompt(creator_text: str) -> str:
     """Prompt for Mediator to challenge assumptions and maybe pivot."""
-    return (
-        "You are the Mediator. Read the Creator’s output below and challenge the core assumption with ONE incisive meta‑question "
-        "(<=80 words) that either (a) reveals a flaw, or (b) suggests a sharper objective. End with a question mark.\n\n"
-        f"Creator output:\n{creator_text}\n"
-    )
+    return _MEDIATOR_PREFIX + creator_text + "\n"
 
 # ------------- Main flow -------------
 
@@ -17,6 +17,7 @@ import sys
 import time
 import json
 import shlex
+import codecs
 import signal
 import pathlib
 import datetime
@@ -171,36 +172,46 @@ def run_ollama(model: str, prompt: str, log: TeeLogger, show_prefix: str) -> str
         stdin=subprocess.PIPE,
         stdout=subprocess.PIPE,
         stderr=subprocess.PIPE,
-        text=True,
-        env=env
+        env=env,
+        bufsize=-1,
     )
 
     # Feed prompt
     try:
         assert proc.stdin is not None
-        proc.stdin.write(prompt)
+        proc.stdin.write(prompt.encode("utf-8", errors="ignore"))
         proc.stdin.flush()
         proc.stdin.close()
     except BrokenPipeError:
         pass
 
-    # Stream + collect
+    # Stream + collect. read1() hands over whatever bytes have arrived instead
+    # of blocking for a newline — models often stream long lines, and readline
+    # would sit on them and delay the console echo.  The incremental decoder
+    # carries multibyte sequences split across chunk boundaries (curly quotes,
+    # em-dashes) instead of dropping them the way a per-chunk decode would.
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
     raw_out_chunks = []
-    # Read stdout line-buffered; if a model prints without newlines, fall back to chunked reads
     while True:
         if proc.stdout is None:
             break
-        line = proc.stdout.readline()
-        if not line:
+        chunk = proc.stdout.read1(65536)
+        if not chunk:
+            text = decoder.decode(b"", final=True)
+            if text:
+                raw_out_chunks.append(text)
             break
-        raw_out_chunks.append(line)
-        cleaned = clean_text(line)
+        text = decoder.decode(chunk)
+        if not text:
+            continue
+        raw_out_chunks.append(text)
+        cleaned = clean_text(text)
         if cleaned:
-            # echo cleaned line to console for human readability
+            # echo cleaned chunk to console for human readability
             print(cleaned)
 
     # Drain stderr
-    stderr = proc.stderr.read() if proc.stderr else ""
+    stderr = proc.stderr.read().decode("utf-8", errors="ignore") if proc.stderr else ""
     ret = proc.wait()
 
     raw_text = "".join(raw_out_chunks)
@@ -215,28 +226,55 @@ def run_ollama(model: str, prompt: str, log: TeeLogger, show_prefix: str) -> str
     return out_clean
 
 # ---------------------- Prompt builders -----------------------
+# Static scaffolding is rendered once at import; builders only concatenate
+# the dynamic pieces into the precomputed frame.
+
+_Q_PREFIX = (
+    "You are the Questioner.\n"
+    "TASK: Repeat the user's topic EXACTLY as given, fixing only obvious spelling and punctuation typos.\n"
+    "- Preserve wording, order, meaning, and all clauses.\n"
+    "- Do NOT simplify, summarize, add context, or change technical terms.\n"
+    "- Output ONLY the corrected topic between these exact markers (no labels or quotes):\n"
+    "<<<BEGIN>>>\n"
+)
+_Q_MID = (
+    "\n<<<END>>>\n"
+    "If you output anything outside the markers, the run will fail.\n\n"
+    "USER TOPIC:\n"
+)
+
+_C_PREFACE = "You are the Creator.\nGiven the Questioner's topic, propose a concrete, actionable mini‑plan in this EXACT format:\n\n"
+_C_BODY = (
+    "## Conceptual Insight\n"
+    "(2–4 sentences)\n\n"
+    "## Practical Mechanism\n"
+    "1. Step ...\n"
+    "2. Step ...\n"
+    "3. Step ...\n"
+    "4. Step ...\n\n"
+    "## Why This Matters\n"
+    "- Bullet\n"
+    "- Bullet\n"
+    "- Bullet\n\n"
+    "Topic:\n"
+)
+
+_M_PREFIX = (
+    "You are the Mediator.\n"
+    "Read the Creator’s response and challenge its core assumption with one concise meta‑question (≤80 words).\n"
+    "Output one question ending with a question mark, nothing else.\n\n"
+    "Creator response:\n"
+)
 
 def build_questioner_prompt(user_topic: str) -> str:
     """
     Force the Questioner to echo the user's topic verbatim with ONLY typo/punctuation fixes.
     The model must return ONLY the corrected topic wrapped in markers.
     """
-    return (
-        "You are the Questioner.\n"
-        "TASK: Repeat the user's topic EXACTLY as given, fixing only obvious spelling and punctuation typos.\n"
-        "- Preserve wording, order, meaning, and all clauses.\n"
-        "- Do NOT simplify, summarize, add context, or change technical terms.\n"
-        "- Output ONLY the corrected topic between these exact markers (no labels or quotes):\n"
-        "<<<BEGIN>>>\n"
-        f"{user_topic}\n"
-        "<<<END>>>\n"
-        "If you output anything outside the markers, the run will fail.\n\n"
-        "USER TOPIC:\n"
-        f"{user_topic}\n"
-    )
+    return _Q_PREFIX + user_topic + _Q_MID + user_topic + "\n"
 
 def build_creator_prompt(topic: str, mediator_q: Optional[str] = None) -> str:
-    preface = "You are the Creator.\nGiven the Questioner's topic, propose a concrete, actionable mini‑plan in this EXACT format:\n\n"
+    preface = _C_PREFACE
     if mediator_q:
         preface += (
             "The Mediator previously asked this meta‑question — you MUST address it explicitly in your plan:\n"
@@ -244,33 +282,15 @@ def build_creator_prompt(topic: str, mediator_q: Optional[str] = None) -> str:
             "Include a single line at the top of your response:\n"
             "Mediator Answer: <one concise sentence answering the meta‑question>\n\n"
         )
-    return (
-        preface +
-        "## Conceptual Insight\n"
-        "(2–4 sentences)\n\n"
-        "## Practical Mechanism\n"
-        "1. Step ...\n"
-        "2. Step ...\n"
-        "3. Step ...\n"
-        "4. Step ...\n\n"
-        "## Why This Matters\n"
-        "- Bullet\n"
-        "- Bullet\n"
-        "- Bullet\n\n"
-        f"Topic:\n{topic}\n"
-    )
+    return preface + _C_BODY + topic + "\n"
 
 def build_mediator_prompt(creator_output: str) -> str:
-    return (
-        "You are the Mediator.\n"
-        "Read the Creator’s response and challenge its core assumption with one concise meta‑question (≤80 words).\n"
-        "Output one question ending with a question mark, nothing else.\n\n"
-        "Creator response:\n"
-        f"{creator_output}\n"
-    )
+    return _M_PREFIX + creator_output + "\n"
 
 # ---------------------- Topic guards --------------------------
 
+_TOK_RE = re.compile(r"[A-Za-z0-9_]+")
+
 def enforce_topic(original: str, candidate: str) -> str:
     """
     Accept the candidate only if it looks like a light typo-fix of the original.
@@ -283,17 +303,14 @@ def enforce_topic(original: str, candidate: str) -> str:
     cand = candidate.strip()
     if not cand:
         return orig
-    # Length heuristic
+    # Length heuristic — bail before tokenizing anything
     if len(cand) < 0.7 * len(orig):
         return orig
     # Token overlap heuristic (long tokens only)
-    tok = re.compile(r"[A-Za-z0-9_]+")
-    orig_tokens = [t.lower() for t in tok.findall(orig)]
-    cand_tokens = [t.lower() for t in tok.findall(cand)]
-    orig_long = {t for t in orig_tokens if len(t) >= 4}
-    cand_long = {t for t in cand_tokens if len(t) >= 4}
+    orig_long = {t.lower() for t in _TOK_RE.findall(orig) if len(t) >= 4}
     if not orig_long:
         return cand  # nothing to compare
+    cand_long = {t.lower() for t in _TOK_RE.findall(cand) if len(t) >= 4}
     overlap = len(orig_long & cand_long) / max(1, len(orig_long))
     if overlap < 0.6:
         return orig
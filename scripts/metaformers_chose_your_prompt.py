@@ -3,25 +3,33 @@
 """
 Meta Discussion — minimal loop
 Ask for a first prompt, then let three local models (Questioner/Creator/Mediator)
-discuss it in turns. Uses Ollama via subprocess; streams output live.
+discuss it in turns. Uses the Ollama HTTP API; streams output live.
 """
 
+import atexit
 import os
 import sys
 import time
-import subprocess
-import select
+import json
+import collections
+from concurrent.futures import ThreadPoolExecutor, Future
 from datetime import datetime, timezone
 from typing import Optional, List
 
+import requests
+
 # ========== Config (env overrides) ==========
-OLLAMA_BIN      = os.environ.get("OLLAMA_BIN", "/usr/local/bin/ollama")
+OLLAMA_URL      = os.environ.get("OLLAMA_URL", "http://127.0.0.1:11434")
 MODEL_QUESTION  = os.environ.get("MODEL_QUESTION", "llama2-uncensored:latest")
 MODEL_CREATOR   = os.environ.get("MODEL_CREATOR",  "gpt-oss:20b")
 MODEL_MEDIATOR  = os.environ.get("MODEL_MEDIATOR", "dolphin3:latest")
 
 ITERATIONS      = int(os.environ.get("ITERATIONS", "12"))     # total turns
 MEDIATOR_EVERY  = int(os.environ.get("MEDIATOR_EVERY", "3"))  # mediator cadence
+# Fold the mediator critique into the Creator call (one generation instead of
+# two on mediator turns). Set MF_FUSE_MEDIATOR=0 to keep the separate model.
+FUSE_MEDIATOR   = os.environ.get("MF_FUSE_MEDIATOR", "1") != "0"
+MEDIATOR_MARK   = "---MEDIATOR---"
 TIMEOUT_SECS    = int(os.environ.get("OLLAMA_TIMEOUT", "600"))
 CTX_WINDOW      = int(os.environ.get("CTX_WINDOW", "3"))      # keep last N utterances as context
 
@@ -43,107 +51,74 @@ def say(role: str, text: str) -> None:
     color = C.get(role, C["dim"])
     print(f"{ts()}{color}{text}{C['rst']}")
 
-# ========== Ollama streaming helper ==========
-def have_ollama() -> bool:
-    return os.path.exists(OLLAMA_BIN) and os.access(OLLAMA_BIN, os.X_OK)
+# ========== Ollama HTTP helper ==========
+# One persistent session against the local Ollama REST API. Compared with
+# spawning `ollama run` per call this skips fork/exec, TTY/ANSI cleanup, and —
+# with keep_alive — repeated model warmup across the turn loop.
+_session = requests.Session()
 
-def ollama_stream(model: str, prompt: str, timeout: int = TIMEOUT_SECS) -> str:
-    """
-    Run `ollama run` with robust streaming:
-    - Reads stdout/stderr without waiting for newline (handles models that emit long lines).
-    - Times out after `timeout` seconds.
-    - Returns the full captured stdout text.
-    """
-    cmd = [OLLAMA_BIN, "run", model]
+KEEP_ALIVE = os.environ.get("OLLAMA_KEEP_ALIVE", "30m")
 
+def have_ollama() -> bool:
     try:
-        proc = subprocess.Popen(
-            cmd,
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            bufsize=0  # unbuffered to get characters immediately
-        )
-    except Exception as e:
-        say("err", f"[ollama] failed to start: {e}")
-        return ""
+        return _session.get(OLLAMA_URL, timeout=5).ok
+    except requests.RequestException:
+        return False
 
-    # Feed prompt
-    try:
-        proc.stdin.write(prompt)
-        proc.stdin.flush()
-        proc.stdin.close()
-    except Exception:
-        pass
+def warm_models(*models: str) -> None:
+    """Preload weights so the first real turn doesn't pay the load cost."""
+    for model in models:
+        try:
+            _session.post(
+                f"{OLLAMA_URL}/api/generate",
+                json={"model": model, "prompt": "", "stream": False, "keep_alive": KEEP_ALIVE},
+                timeout=TIMEOUT_SECS,
+            )
+        except requests.RequestException as e:
+            say("err", f"[warmup] {model}: {e}")
 
+def ollama_stream(model: str, prompt: str, timeout: int = TIMEOUT_SECS, quiet: bool = False) -> str:
+    """
+    Generate via POST /api/generate with "stream": true:
+    - Emits tokens to stdout as they arrive (live-stream UX); quiet=True
+      suppresses the echo (used for calls running in the background).
+    - keep_alive keeps the model resident between turns.
+    - Returns the full response text.
+    """
     out_chunks: List[str] = []
-    err_chunks: List[str] = []
-    start = time.time()
-
-    # Helper to flush any remaining data when proc exits
-    def _drain():
-        try:
-            so, se = proc.communicate(timeout=0.1)
-        except Exception:
-            so, se = ("", "")
-        if so:
-            print(so, end="")
-            out_chunks.append(so)
-        if se:
-            for line in se.splitlines():
-                print(f"[STDERR] {line}")
-            err_chunks.append(se)
-
-    # Non-blocking select loop
-    stdout_fd = proc.stdout.fileno() if proc.stdout else None
-    stderr_fd = proc.stderr.fileno() if proc.stderr else None
-
-    # Print a small hint once
-    printed_hint = False
-
-    while True:
-        # Timeout guard
-        if time.time() - start > timeout:
-            proc.kill()
-            say("err", "[timeout] model exceeded time limit")
-            break
-
-        fds = []
-        if stdout_fd is not None:
-            fds.append(stdout_fd)
-        if stderr_fd is not None:
-            fds.append(stderr_fd)
-
-        if not fds:
-            break
-
-        rlist, _, _ = select.select(fds, [], [], 0.1)
-
-        if stdout_fd in rlist:
-            chunk = proc.stdout.read(1)
-            if chunk:
-                if not printed_hint:
-                    say("dim", "Streaming model output…")
-                    printed_hint = True
-                print(chunk, end="", flush=True)
-                out_chunks.append(chunk)
-
-        if stderr_fd in rlist:
-            err_chunk = proc.stderr.read(1)
-            if err_chunk:
-                # Buffer stderr until newline for cleaner prints
-                if err_chunk == "\n":
-                    print(f"[STDERR] ", end="")
-                else:
-                    print(err_chunk, end="", flush=True)
-                err_chunks.append(err_chunk)
-
-        # Exit if process finished and pipes drained
-        if proc.poll() is not None:
-            # Drain any remaining buffered data
-            _drain()
-            break
+    try:
+        r = _session.post(
+            f"{OLLAMA_URL}/api/generate",
+            json={"model": model, "prompt": prompt, "stream": True, "keep_alive": KEEP_ALIVE},
+            stream=True,
+            timeout=timeout,
+        )
+        r.raise_for_status()
+        printed_hint = False
+        # 4 KiB reads + flush-on-whitespace: batches syscalls instead of one
+        # write+flush per token without hurting perceived streaming.
+        for line in r.iter_lines(chunk_size=4096):
+            if not line:
+                continue
+            piece = json.loads(line)
+            tok = piece.get("response", "")
+            if tok:
+                if not quiet:
+                    if not printed_hint:
+                        say("dim", "Streaming model output…")
+                        printed_hint = True
+                    sys.stdout.write(tok)
+                    if tok[-1].isspace():
+                        sys.stdout.flush()
+                out_chunks.append(tok)
+            if piece.get("done"):
+                break
+        if not quiet:
+            sys.stdout.flush()
+    except requests.Timeout:
+        say("err", "[timeout] model exceeded time limit")
+    except (requests.RequestException, ValueError) as e:
+        say("err", f"[ollama] request failed: {e}")
 
     return "".join(out_chunks).strip()
 
@@ -164,45 +139,85 @@ M_SEED = (
     " End with ONE incisive question. No preamble."
 )
 
-def make_context(history: List[str]) -> str:
-    """Join the last few turns into a compact context."""
-    if not history:
-        return ""
-    tail = history[-CTX_WINDOW:]
-    return "\n\n".join(tail)
-
 # ========== Transcript folder ==========
-def ensure_run_dir() -> str:
+def ensure_run_dir():
+    """Create runs/<ts>/ and open transcript.txt ONCE for the whole run."""
     root = os.getcwd()
     runs = os.path.join(root, "runs")
     os.makedirs(runs, exist_ok=True)
     run_id = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
     run_dir = os.path.join(runs, run_id)
     os.makedirs(run_dir, exist_ok=True)
-    return run_dir
+    transcript_fp = open(os.path.join(run_dir, "transcript.txt"), "a",
+                         encoding="utf-8", buffering=8192)
+    atexit.register(transcript_fp.close)
+    return run_dir, transcript_fp
 
-def write_transcript(run_dir: str, text: str) -> None:
+_transcript_writes = 0
+
+def write_transcript(fp, text: str) -> None:
+    # Buffered handle held open for the run; flush every few utterances so a
+    # crash loses at most a turn, without paying open/close per line.
+    global _transcript_writes
     try:
-        path = os.path.join(run_dir, "transcript.txt")
-        with open(path, "a", encoding="utf-8") as f:
-            f.write(text + "\n")
+        fp.write(text + "\n")
+        _transcript_writes += 1
+        if _transcript_writes % 4 == 0:
+            fp.flush()
     except Exception as e:
         say("err", f"[transcript] write failed: {e}")
 
 # ========== Main ==========
 def main() -> None:
     if not have_ollama():
-        say("err", f"Ollama not found at {OLLAMA_BIN}")
+        say("err", f"Ollama not reachable at {OLLAMA_URL}")
         sys.exit(1)
 
     say("ok", "Meta Discussion — three local models, one topic.")
+    say("dim", "Warming models (keep_alive keeps them resident)…")
+    warm_models(MODEL_QUESTION, MODEL_CREATOR, MODEL_MEDIATOR)
     user_topic = input("First prompt (what should they discuss?): ").strip()
     if not user_topic:
         say("err", "Empty prompt. Exiting.")
         sys.exit(2)
 
-    run_dir = ensure_run_dir()
-    history: List[str] = [f"User topic: {user_topic}"]
+    run_dir, transcript_fp = ensure_run_dir()
+    # Bounded deque drops old turns for free; the joined context is cached and
+    # rebuilt once per append instead of on every one of three calls per turn.
+    history: collections.deque = collections.deque(maxlen=CTX_WINDOW)
+    context_cache = ""
+
+    def remember(entry: str) -> None:
+        nonlocal context_cache
+        history.append(entry)
+        context_cache = "\n\n".join(history)
+
+    remember(f"User topic: {user_topic}")
+
+    # The seed + topic preamble of each prompt is fixed for the whole run;
+    # render it once so each turn only appends the mutable tail.
+    q_head = f"{Q_SEED}\n\nUser topic:\n{user_topic}\n\nRecent context:\n"
+    c_head = f"{C_SEED}\n\nUser topic:\n{user_topic}\n\n"
+    m_head = f"{M_SEED}\n\nUser topic:\n{user_topic}\n\n"
+
+    # Mediator turns run in the background so the next Questioner can start
+    # immediately; Ollama batches the two streams when OLLAMA_NUM_PARALLEL>=2.
+    os.environ.setdefault("OLLAMA_NUM_PARALLEL", "2")
+    executor = ThreadPoolExecutor(max_workers=2)
+    pending_mediator: Optional[Future] = None
+
+    def join_mediator() -> None:
+        nonlocal pending_mediator
+        if pending_mediator is None:
+            return
+        m_text = pending_mediator.result().strip()
+        pending_mediator = None
+        if m_text:
+            say("m", f"[{MODEL_MEDIATOR}] >>>")
+            print(m_text)
+            remember(f"Mediator: {m_text}")
+            write_transcript(transcript_fp, f"[M] {m_text}")
+            print()
 
     say("ok", f"Run folder: {run_dir}")
     print()
@@ -210,56 +225,74 @@ def main() -> None:
     for i in range(1, ITERATIONS + 1):
         say("dim", f"=== Turn {i}/{ITERATIONS} ===")
 
-        # Questioner
-        q_prompt = (
-            f"{Q_SEED}\n\n"
-            f"User topic:\n{user_topic}\n\n"
-            f"Recent context:\n{make_context(history)}\n\n"
-            f"Your question:"
-        )
+        # Questioner (doesn't need the still-running mediator from last turn)
+        q_prompt = q_head + context_cache + "\n\nYour question:"
         say("q", f"[{MODEL_QUESTION}] <<<")
         q_text = ollama_stream(MODEL_QUESTION, q_prompt, timeout=TIMEOUT_SECS)
         q_text = q_text.strip()
-        history.append(f"Questioner: {q_text}")
-        write_transcript(run_dir, f"[Q] {q_text}")
+        remember(f"Questioner: {q_text}")
+        write_transcript(transcript_fp, f"[Q] {q_text}")
         print()
 
-        # Creator
+        # The Creator's context must include the mediator, so join it here.
+        join_mediator()
+
+        # Creator — on mediator turns, ask for a draft + self-critique in ONE
+        # generation so we skip the extra model call entirely.
+        is_mediator_turn = i % MEDIATOR_EVERY == 0
         c_prompt = (
-            f"{C_SEED}\n\n"
-            f"User topic:\n{user_topic}\n\n"
-            f"Questioner asked:\n{q_text}\n\n"
-            f"Recent context:\n{make_context(history)}\n\n"
-            f"Creator answer:"
+            c_head
+            + f"Questioner asked:\n{q_text}\n\n"
+            + f"Recent context:\n{context_cache}\n\n"
+            + "Creator answer:"
         )
+        if is_mediator_turn and FUSE_MEDIATOR:
+            c_prompt += (
+                f"\n\nThen, after a line containing exactly '{MEDIATOR_MARK}', switch to the "
+                "Mediator role: in ≤40 words challenge a hidden assumption or risk in your own "
+                "answer, ending with ONE incisive question."
+            )
         say("c", f"[{MODEL_CREATOR}] <<<")
         c_text = ollama_stream(
             MODEL_CREATOR,
             c_prompt,
             timeout=TIMEOUT_SECS,
         ).strip()
-        history.append(f"Creator: {c_text}")
-        write_transcript(run_dir, f"[C] {c_text}")
+        fused_m_text = ""
+        if is_mediator_turn and FUSE_MEDIATOR and MEDIATOR_MARK in c_text:
+            c_text, fused_m_text = (part.strip() for part in c_text.split(MEDIATOR_MARK, 1))
+        remember(f"Creator: {c_text}")
+        write_transcript(transcript_fp, f"[C] {c_text}")
         print()
 
-        # Mediator every N
-        if i % MEDIATOR_EVERY == 0:
+        if fused_m_text:
+            say("m", f"[{MODEL_CREATOR}] (self-critique) >>>")
+            remember(f"Mediator: {fused_m_text}")
+            write_transcript(transcript_fp, f"[M] {fused_m_text}")
+            print()
+        elif is_mediator_turn:
+            # Separate mediator model — fired in the background; the next
+            # turn's Questioner overlaps with it and we join before the next
+            # Creator. Also the fallback when the fused marker didn't appear.
             m_prompt = (
-                f"{M_SEED}\n\n"
-                f"User topic:\n{user_topic}\n\n"
-                f"Question:\n{q_text}\n\n"
-                f"Creator answer:\n{c_text}\n\n"
-                f"Mediator critique:"
+                m_head
+                + f"Question:\n{q_text}\n\n"
+                + f"Creator answer:\n{c_text}\n\n"
+                + "Mediator critique:"
+            )
+            say("m", f"[{MODEL_MEDIATOR}] <<< (running in background)")
+            pending_mediator = executor.submit(
+                ollama_stream, MODEL_MEDIATOR, m_prompt, TIMEOUT_SECS, True
             )
-            say("m", f"[{MODEL_MEDIATOR}] <<<")
-            m_text = ollama_stream(MODEL_MEDIATOR, m_prompt, timeout=TIMEOUT_SECS).strip()
-            history.append(f"Mediator: {m_text}")
-            write_transcript(run_dir, f"[M] {m_text}")
-            print()
 
         # Small breath so the terminal is readable
         time.sleep(0.3)
 
+    # Don't lose a mediator still in flight after the final turn
+    join_mediator()
+    executor.shutdown(wait=True)
+    transcript_fp.flush()
+
     say("ok", "Done. Transcript saved under runs/<timestamp>/transcript.txt")
 
 if __name__ == "__main__":
@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Metaformers — shared infrastructure for the role-loop scripts.
+
+metaformers_v2.py and metaformers_with_reviewer.py used to duplicate the
+config, text cleanup, logging, and Ollama plumbing (~400 lines each);
+everything role-agnostic now lives here so regexes compile once, the HTTP
+session / caches are shared, and a fix lands in one place.  The scripts
+keep only their own prompt variants and turn loops.
+"""
+
+import io
+import os
+import re
+import sys
+import json
+import time
+import atexit
+import asyncio
+import pathlib
+import threading
+from typing import Optional
+
+try:
+    import requests
+except Exception:
+    print("[fatal] This script requires `requests` (pip install requests).", file=sys.stderr)
+    sys.exit(2)
+
+try:
+    import cache as response_cache  # on-disk exact-match cache (optional)
+except Exception:
+    response_cache = None
+
+try:
+    import zstandard  # optional: compress finished .log files on close
+except Exception:
+    zstandard = None
+
+__all__ = [
+    "QUESTIONER", "CREATOR", "MEDIATOR", "REVIEWER", "OLLAMA_HOST",
+    "MEDIATOR_EVERY_DEFAULT", "REFRESH_QUESTIONER", "LOG_COMPRESS",
+    "ROOT", "RUNS_DIR", "KEEP_ALIVE", "SESSION",
+    "ts_iso", "ts_compact",
+    "ANSI_RE", "SPINNER_RE", "LABEL_RE", "QUOTE_CHARS",
+    "clean_text", "strip_leading_labels", "strip_wrapping_quotes",
+    "normalize_topic", "extract_marked",
+    "TeeLogger",
+    "check_ollama_or_die", "warm_models", "run_ollama", "run_ollama_async",
+    "build_questioner_prompt", "build_mediator_prompt", "cap_prompt",
+    "enforce_topic",
+]
+
+# --------------------------- Config ---------------------------
+
+QUESTIONER = os.environ.get("MF_QUESTIONER", "llama2-uncensored:latest")
+CREATOR    = os.environ.get("MF_CREATOR",    "gpt-oss:20b")
+MEDIATOR   = os.environ.get("MF_MEDIATOR",   "dolphin3:latest")
+REVIEWER   = os.environ.get("MF_REVIEWER",   "dolphin3:latest")
+OLLAMA_HOST = os.environ.get("OLLAMA_HOST", "http://127.0.0.1:11434")
+
+# Let the server batch concurrent role calls instead of queueing them.
+os.environ.setdefault("OLLAMA_NUM_PARALLEL", "3")
+
+# Mediator cadence (every how many turns); 0 disables mediator
+MEDIATOR_EVERY_DEFAULT = int(os.environ.get("MF_MEDIATOR_EVERY", "4"))
+
+# The Questioner's typo-fix is deterministic and the topic is frozen after
+# turn 1; set MF_REFRESH_QUESTIONER=1 to re-run it every turn anyway.
+REFRESH_QUESTIONER = os.environ.get("MF_REFRESH_QUESTIONER", "0") == "1"
+
+# Per-role .log files compress to .log.zst on close (4-10x on this kind of
+# text); transcript.txt stays plain for easy `less`ing.  MF_LOG_COMPRESS=0
+# keeps everything uncompressed.
+LOG_COMPRESS = os.environ.get("MF_LOG_COMPRESS", "1") == "1"
+
+ROOT = pathlib.Path.cwd()
+RUNS_DIR = ROOT / "runs"
+
+# ---------------------- Timestamps ----------------------------
+
+# ts_iso runs on every TeeLogger.write; render both formats at most once per
+# wall-clock second instead of building a datetime per call.
+_LAST_TS = [0, "", ""]  # [second, iso, compact]
+
+def _refresh_ts() -> None:
+    now = int(time.time())
+    if now != _LAST_TS[0]:
+        gm = time.gmtime(now)
+        _LAST_TS[0] = now
+        _LAST_TS[1] = time.strftime("%Y-%m-%dT%H:%M:%SZ", gm)
+        _LAST_TS[2] = time.strftime("%Y%m%d-%H%M%S", gm)
+
+def ts_iso() -> str:
+    _refresh_ts()
+    return _LAST_TS[1]
+
+def ts_compact() -> str:
+    _refresh_ts()
+    return _LAST_TS[2]
+
+# ---------------------- Text cleanup --------------------------
+
+ANSI_RE = re.compile(
+    r"(?:\x1B\[[0-9;?]*[ -/]*[@-~])"    # CSI sequences
+    r"|(?:\x1B[@-Z\\-_])"               # 2-byte ESC
+    r"|(?:\x1B\][^\x07]*\x07)"          # OSC … BEL
+)
+
+SPINNER_RE = re.compile(r"[⠀-⣿◐◓◑◒⠋⠙⠹⠸⠼⠴⠦⠧⠇⠏]+")
+# ANSI + spinner fused into one alternation: one sub() pass instead of two.
+_CLEAN_RE = re.compile(ANSI_RE.pattern + "|" + SPINNER_RE.pattern)
+
+# Hot-path patterns, compiled once; clean_text runs on every streamed chunk.
+_WS_RE = re.compile(r"[ \t]+")
+_MULTI_NL_RE = re.compile(r"\n{3,}")
+_MARKED_RE = re.compile(r"<<<BEGIN>>>\s*(.*?)\s*<<<END>>>", re.S)
+_TOK_RE = re.compile(r"[A-Za-z0-9_]+")
+
+def clean_text(s: str) -> str:
+    if not s:
+        return s
+    s = _CLEAN_RE.sub("", s)
+    s = s.replace("\r", "")
+    s = _WS_RE.sub(" ", s)
+    s = _MULTI_NL_RE.sub("\n\n", s)
+    return s.strip()
+
+LABEL_RE = re.compile(
+    r'^\s*(?:>{1,3}\s*)?'
+    r'(?:topic|corrected\s*topic|final\s*topic|revised\s*topic|clean(?:ed)?\s*topic|prompt)'
+    r'\s*[:\-]\s*',
+    re.I,
+)
+QUOTE_CHARS = '"\'`“”‘’'
+
+def strip_leading_labels(s: str) -> str:
+    out = s or ""
+    for _ in range(2):
+        out = LABEL_RE.sub("", out)
+    return out.strip()
+
+def strip_wrapping_quotes(s: str) -> str:
+    # str.strip's C loop subsumes the old quote-peeling while-loops (which
+    # also stripped unbalanced runs via their trailing passes).
+    out = (s or "").strip()
+    out = out.strip(QUOTE_CHARS)
+    return out.strip()
+
+def normalize_topic(s: str) -> str:
+    s = clean_text(s or "")
+    s = strip_leading_labels(s)
+    s = strip_wrapping_quotes(s)
+    return s.strip()
+
+def extract_marked(s: str) -> str:
+    """
+    Extract text between <<<BEGIN>>> and <<<END>>> if present; else return normalized s.
+    """
+    if not s:
+        return ""
+    m = _MARKED_RE.search(s)
+    if m:
+        return normalize_topic(m.group(1))
+    return normalize_topic(s)
+
+# ------------------------- Logging ----------------------------
+
+# One lock across all loggers: concurrent role calls stream from worker
+# threads, and interleaved half-lines in the logs are worse than a tiny wait.
+_LOG_LOCK = threading.Lock()
+
+class TeeLogger:
+    def __init__(self, path: pathlib.Path):
+        self.path = path
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # 64 KiB buffer: log lines hit disk in batches instead of one
+        # write+flush syscall pair per line.  atexit covers sys.exit paths.
+        self._fh = self.path.open("a", encoding="utf-8", buffering=64 * 1024)
+        atexit.register(self.flush)
+
+    def write(self, line: str, also_stdout: bool = False):
+        stamp = f"[{ts_iso()}] "
+        text = stamp + line.rstrip("\n")
+        with _LOG_LOCK:
+            self._fh.write(text + "\n")
+            if also_stdout:
+                print(text)
+
+    def flush(self):
+        try:
+            self._fh.flush()
+        except Exception:
+            pass
+
+    def close(self):
+        try:
+            self._fh.close()
+        except Exception:
+            pass
+        if zstandard is not None and LOG_COMPRESS and self.path.suffix == ".log":
+            threading.Thread(target=self._compress_log).start()
+
+    def _compress_log(self):
+        # Off the main thread: the run is over, no need to wait on zstd.
+        try:
+            dst = self.path.with_suffix(".log.zst")
+            with self.path.open("rb") as src, dst.open("wb") as out:
+                zstandard.ZstdCompressor(level=3).copy_stream(src, out)
+            self.path.unlink()
+        except Exception:
+            pass
+
+# ---------------------- Ollama invocation ---------------------
+
+# Persistent session: models stay resident server-side (keep_alive) and the
+# loopback connection is reused across every call of the run.
+SESSION = requests.Session()
+KEEP_ALIVE = os.environ.get("MF_KEEP_ALIVE", "30m")
+
+# Bound concurrent generations to what the server batches.
+_SEM = asyncio.Semaphore(int(os.environ.get("OLLAMA_NUM_PARALLEL", "3")))
+
+def check_ollama_or_die():
+    try:
+        if SESSION.get(f"{OLLAMA_HOST}/api/tags", timeout=5).ok:
+            return
+    except requests.RequestException:
+        pass
+    print(f"[{ts_iso()}] [fatal] Ollama server not reachable at: {OLLAMA_HOST}", file=sys.stderr)
+    sys.exit(2)
+
+async def warm_models(models) -> None:
+    """Load every distinct role model in parallel: an empty-prompt generate
+    makes the server pull the weights into memory with keep_alive, so the
+    cold-start cost is the slowest model instead of the sum of all of them."""
+    async def _load(m: str) -> None:
+        t0 = time.monotonic()
+        try:
+            await asyncio.to_thread(
+                SESSION.post,
+                f"{OLLAMA_HOST}/api/generate",
+                json={"model": m, "prompt": "", "keep_alive": KEEP_ALIVE},
+                timeout=600,
+            )
+            print(f"[{ts_iso()}] [warmup] {m} loaded in {time.monotonic() - t0:.1f}s", flush=True)
+        except requests.RequestException:
+            print(f"[{ts_iso()}] [warmup] {m} not reachable (will load on first call)", flush=True)
+    await asyncio.gather(*(_load(m) for m in dict.fromkeys(models)))
+
+# In-process hits for repeated identical calls within one run; the disk cache
+# (scripts/cache.py, sqlite) covers replays across runs.
+_GEN_CACHE: dict = {}
+
+def run_ollama(model: str, prompt: str, log: TeeLogger, show_prefix: str, cacheable: bool = False) -> str:
+    """
+    Generate via POST /api/generate; stream cleaned output to console; return cleaned full text.
+    Deterministic calls (the Questioner typo-fix) pass cacheable=True and may
+    be served from the exact-match cache without touching the model.
+    """
+    key = None
+    if cacheable:
+        hit = _GEN_CACHE.get((model, prompt))
+        if hit is None and response_cache is not None:
+            key = response_cache.make_key(model, prompt)
+            hit = response_cache.get(key)
+        if hit is not None:
+            log.write("PROMPT:\n" + prompt)
+            log.write("OUTPUT (cached):\n" + hit)
+            print(f"[{ts_iso()}] [{model}] <<< (cached)", flush=True)
+            return hit
+
+    log.write("PROMPT:\n" + prompt)
+    print(f"[{ts_iso()}] [{model}] <<<", flush=True)
+
+    # One growing buffer instead of a list of token strings + final join:
+    # halves the peak heap held for a response (no per-str object overhead,
+    # no O(N) join copy at the end).
+    raw_out = io.StringIO()
+    echo_buf = ""
+    err_clean = ""
+    try:
+        r = SESSION.post(
+            f"{OLLAMA_HOST}/api/generate",
+            json={"model": model, "prompt": prompt, "stream": True, "keep_alive": KEEP_ALIVE},
+            stream=True,
+            timeout=600,
+        )
+        r.raise_for_status()
+        for line in r.iter_lines():
+            if not line:
+                continue
+            piece = json.loads(line)
+            tok = piece.get("response", "")
+            if tok:
+                raw_out.write(tok)
+                # Buffer the echo: clean_text is five regex passes, so run it
+                # per completed line (or per ~4 KiB), not per streamed token.
+                echo_buf += tok
+                if "\n" in echo_buf or len(echo_buf) >= 4096:
+                    cleaned = clean_text(echo_buf)
+                    if cleaned:
+                        # Raw fd write: skips print's io stack + per-call
+                        # encoding lookup on the hottest path of the run.
+                        os.write(1, cleaned.encode("utf-8", "replace") + b"\n")
+                    echo_buf = ""
+            if piece.get("done"):
+                break
+    except requests.RequestException as e:
+        err_clean = str(e)
+    if echo_buf:
+        cleaned = clean_text(echo_buf)
+        if cleaned:
+            os.write(1, cleaned.encode("utf-8", "replace") + b"\n")
+
+    out_clean = clean_text(raw_out.getvalue()).strip()
+    if err_clean:
+        log.write(f"[STDERR] {err_clean}", also_stdout=True)
+
+    log.write("OUTPUT:\n" + out_clean)
+    if cacheable and out_clean and not err_clean:
+        _GEN_CACHE[(model, prompt)] = out_clean
+        if response_cache is not None:
+            response_cache.put(key or response_cache.make_key(model, prompt), out_clean)
+    return out_clean
+
+async def run_ollama_async(model: str, prompt: str, log: TeeLogger, show_prefix: str, cacheable: bool = False) -> str:
+    """Async wrapper: run_ollama in a worker thread under the parallel bound."""
+    async with _SEM:
+        return await asyncio.to_thread(run_ollama, model, prompt, log, show_prefix, cacheable)
+
+# ---------------------- Shared prompts ------------------------
+
+# Templates are assembled once at import; the builders only fill the holes
+# via format_map instead of re-concatenating the boilerplate every turn.
+# The Creator/Reviewer templates differ per script and stay with them.
+_QUESTIONER_TMPL = (
+    "You are the Questioner.\n"
+    "TASK: Output the user's topic EXACTLY as provided, correcting only obvious typos.\n"
+    "- Do NOT rephrase or change word order.\n"
+    "- Do NOT add/remove meaning.\n"
+    "- Output ONLY the corrected topic between the markers below.\n"
+    "- Do NOT include labels like 'Topic:' inside the markers.\n\n"
+    "<<<BEGIN>>>\n"
+    "<corrected topic here>\n"
+    "<<<END>>>\n\n"
+    "USER TOPIC:\n"
+    "{topic}\n"
+)
+
+_MEDIATOR_TMPL = (
+    "You are the Mediator.\n"
+    "Read the Creator’s response and challenge a core assumption with ONE concise meta‑question (≤80 words).\n"
+    "Output ONE question that ends with a question mark. Nothing else.\n\n"
+    "Creator response:\n"
+    "{creator_output}\n"
+)
+
+def build_questioner_prompt(user_topic: str) -> str:
+    """
+    Force Questioner to return ONLY your topic with typo fixes — no rephrasing, no labels.
+    """
+    return _QUESTIONER_TMPL.format_map({"topic": user_topic})
+
+def cap_prompt(s: str, n: int = 1500) -> str:
+    """Head+tail truncation: the Mediator/Reviewer only need enough context
+    to challenge or summarize, not the Creator's full multi-thousand-token
+    response — prompt tokens are the bulk of those calls' latency."""
+    if len(s) <= n:
+        return s
+    return s[:500] + "\n…[truncated]…\n" + s[-1000:]
+
+def build_mediator_prompt(creator_output: str) -> str:
+    return _MEDIATOR_TMPL.format_map({"creator_output": cap_prompt(creator_output)})
+
+# ---------------------- Topic guards --------------------------
+
+def enforce_topic(original: str, candidate: str) -> str:
+    """
+    Accept candidate if it looks like a light typo-fix:
+      - length ratio >= 0.7
+      - token overlap (tokens len>=4) >= 0.6
+    Otherwise, keep original.
+    """
+    orig = original.strip()
+    cand = (candidate or "").strip()
+    if not cand:
+        return orig
+    if len(cand) < 0.7 * len(orig):
+        return orig
+    # Build the ≥4-char token sets in one pass; the length test on match
+    # spans avoids allocating substrings for short tokens.
+    o4 = {m.group().lower() for m in _TOK_RE.finditer(orig) if m.end() - m.start() >= 4}
+    c4 = {m.group().lower() for m in _TOK_RE.finditer(cand) if m.end() - m.start() >= 4}
+    if not o4:
+        return cand
+    overlap = len(o4 & c4) / max(1, len(o4))
+    if overlap < 0.6:
+        return orig
+    return cand
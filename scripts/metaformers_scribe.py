@@ -29,136 +29,262 @@ Usage
 from __future__ import annotations
 
 import os, sys, re, json, argparse
+import hashlib
+import time
+import http.client
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from datetime import datetime
-import subprocess
-import shutil
 
 # ---------- Config ----------
 DEFAULT_SUMMARIZER = os.environ.get("SCRIBE_MODEL", "dolphin3:latest")
-OLLAMA_BIN = os.environ.get("OLLAMA_BIN", "/usr/local/bin/ollama")
+OLLAMA_HOST = os.environ.get("OLLAMA_HOST", "127.0.0.1")
+OLLAMA_PORT = int(os.environ.get("OLLAMA_PORT", "11434"))
 
 # Chunking + output safety
 CHARS_PER_CHUNK = int(os.environ.get("SCRIBE_CHUNK_SIZE", "6000"))
 MAX_SUMMARY_BYTES = int(os.environ.get("SCRIBE_MAX_BYTES", str(500 * 1024)))  # ~500 KB
 
+# Content-addressed chunk-summary cache: re-running the scribe on the same run
+# dir hits 100% (chunks are deterministic slices of the cleaned logs).
+CACHE_DIR = Path(os.environ.get("SCRIBE_CACHE_DIR",
+                                os.path.expanduser("~/.cache/metaformers_scribe")))
+CACHE_MAX_BYTES = int(os.environ.get("SCRIBE_CACHE_MAX", str(50 * 1024 * 1024)))  # ~50 MB
+
 # ---------- ANSI / Spinner cleanup ----------
-_ANSI_CSI = re.compile(r"\x1b\[[0-?]*[ -/]*[@-~]")
-_ANSI_OSC = re.compile(r"\x1b\][^\x07]*\x07")
-_ANSI_C1  = re.compile(r"\x1b[@-Z\\-_]")
-_BACKSPACE_OVERSTRIKE = re.compile(r".\x08")
-_SPINNER_BLOCK_RE = re.compile(r'(?:[\u2800-\u28FF]\s*){2,}')  # braille runs
-
-def strip_ansi(s: str) -> str:
-    s = s.replace("\r", "")
-    while True:
-        new = _BACKSPACE_OVERSTRIKE.sub("", s)
-        if new == s: break
-        s = new
-    s = _ANSI_OSC.sub("", s)
-    s = _ANSI_CSI.sub("", s)
-    s = _ANSI_C1.sub("", s)
-    return s
-
-def strip_spinners(s: str) -> str:
-    s = _SPINNER_BLOCK_RE.sub('', s)
-    s = re.sub(r'^(?:[\u2800-\u28FF]\s*)+', '', s, flags=re.M)
-    return s
+# OSC/CSI/C1 escapes and braille spinner runs fused into ONE alternation so a
+# multi-MB log gets a single regex sweep instead of five.
+_FUSED_NOISE = re.compile(
+    r"\x1b\][^\x07]*\x07"            # OSC \u2026 BEL
+    r"|\x1b\[[0-?]*[ -/]*[@-~]"      # CSI
+    r"|\x1b[@-Z\\-_]"                # single-byte C1
+    r"|(?:[\u2800-\u28FF]\s*){2,}"   # braille spinner runs
+    r"|^(?:[\u2800-\u28FF]\s*)+",    # stray braille at line starts
+    re.M,
+)
+def _strip_backspaces(s: str) -> str:
+    # Single O(n) walk: a \x08 pops the previous char. The old regex
+    # fixed-point loop went quadratic on long overstrike runs.
+    if "\x08" not in s:
+        return s
+    out: list[str] = []
+    for c in s:
+        if c == "\x08":
+            if out:
+                out.pop()
+        else:
+            out.append(c)
+    return "".join(out)
 
 def sanitize(s: str) -> str:
-    return strip_spinners(strip_ansi(s))
+    s = _strip_backspaces(s.replace("\r", ""))
+    return _FUSED_NOISE.sub("", s)
 
 # ---------- Filesystem helpers ----------
+_ts_last_sec = 0
+_ts_last_str = ""
+
 def ts() -> str:
-    return datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+    # Progress logs call this many times a second; reformat only when the
+    # second actually changes.
+    global _ts_last_sec, _ts_last_str
+    t = int(time.time())
+    if t != _ts_last_sec:
+        _ts_last_sec = t
+        _ts_last_str = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(t))
+    return _ts_last_str
 
 def find_latest_run(base: Path) -> Path | None:
     runs = sorted((p for p in (base / "runs").glob("*") if p.is_dir()),
                   key=lambda p: p.name, reverse=True)
     return runs[0] if runs else None
 
+# Accept multiple naming styles from your various scripts
+_ROLE_PREFIXES = (
+    ("master",     ("master_", "ai_master_", "master")),
+    ("questioner", ("questioner_", "llama2_questioner_")),
+    ("creator",    ("creator_", "gpt_oss_creator_")),
+    ("mediator",   ("mediator_", "dolphin3_mediator_")),
+)
+
 def pick_logs(run_dir: Path) -> dict[str, Path]:
     logs = run_dir / "logs"
     if not logs.is_dir():
         return {}
-    # Accept multiple naming styles from your various scripts
-    cand = {}
-    # master
-    for pat in ("master_*.log", "ai_master_*.log", "master*.log"):
-        found = list(logs.glob(pat))
-        if found: cand["master"] = sorted(found)[-1]; break
-    # questioner
-    for pat in ("questioner_*.log", "llama2_questioner_*.log"):
-        found = list(logs.glob(pat))
-        if found: cand["questioner"] = sorted(found)[-1]; break
-    # creator
-    for pat in ("creator_*.log", "gpt_oss_creator_*.log"):
-        found = list(logs.glob(pat))
-        if found: cand["creator"] = sorted(found)[-1]; break
-    # mediator
-    for pat in ("mediator_*.log", "dolphin3_mediator_*.log"):
-        found = list(logs.glob(pat))
-        if found: cand["mediator"] = sorted(found)[-1]; break
+    # One scandir instead of a dozen globs: dispatch on filename prefix and
+    # keep the most recent file per role.
+    cand: dict[str, Path] = {}
+    best_mtime: dict[str, float] = {}
+    with os.scandir(logs) as it:
+        for e in it:
+            if not e.is_file() or not e.name.endswith(".log"):
+                continue
+            for role, prefixes in _ROLE_PREFIXES:
+                if e.name.startswith(prefixes):
+                    mt = e.stat().st_mtime
+                    if mt >= best_mtime.get(role, -1.0):
+                        best_mtime[role] = mt
+                        cand[role] = Path(e.path)
+                    break
     return cand
 
 def slurp_clean(path: Path, max_bytes: int = 3_000_000) -> str:
     if not path.exists():
         return ""
-    # Read bounded to avoid huge files
-    data = path.read_text(encoding="utf-8", errors="ignore")
-    if len(data) > max_bytes:
-        data = data[-max_bytes:]  # last N bytes (most recent)
-    return sanitize(data)
+    # Seek to the tail instead of reading the whole file; only the most
+    # recent max_bytes ever make it into the transcript anyway.
+    size = path.stat().st_size
+    with path.open("rb") as f:
+        if size > max_bytes:
+            f.seek(size - max_bytes)
+        buf = f.read()
+    return sanitize(buf.decode("utf-8", errors="ignore"))
 
 # ---------- Summarization ----------
+# Prompts run multi-KB; orjson escapes strings in C and returns bytes directly,
+# skipping stdlib's Python-level escaping + the extra utf-8 encode.
+try:
+    import orjson
+
+    def _json_body(obj) -> bytes:
+        return orjson.dumps(obj)
+except ImportError:
+    def _json_body(obj) -> bytes:
+        return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+
+# One persistent HTTP connection per worker thread; /api/generate with
+# keep_alive keeps the model resident, so no fork/exec or TTY scrub per chunk.
+_conn_local = threading.local()
+
+def _ollama_conn(timeout: int) -> http.client.HTTPConnection:
+    conn = getattr(_conn_local, "conn", None)
+    if conn is None:
+        conn = http.client.HTTPConnection(OLLAMA_HOST, OLLAMA_PORT, timeout=timeout)
+        _conn_local.conn = conn
+    return conn
+
+# Context window discovered by adaptive_chunk_size; 0 means "not probed",
+# in which case the server's default num_ctx is fine for default-size chunks.
+_MODEL_CTX = 0
+
 def ollama_summarize(model: str, prompt: str, timeout: int = 60) -> str:
     """
-    Run `ollama run <model>` with a hard timeout and non-TTY env so it
-    doesn't emit spinners/ANSI. Returns cleaned text or a warning.
+    Summarize via POST /api/generate on a persistent local connection.
+    Returns cleaned text or a warning.
     """
-    if not shutil.which(OLLAMA_BIN):
-        return f"[fatal] ollama not found at {OLLAMA_BIN}"
-
-    env = os.environ.copy()
-    env.update({
-        "TERM": "dumb",
-        "NO_COLOR": "1",
-        "CLICOLOR": "0",
-        "COLORTERM": "0",
-        "OLLAMA_SHELL": "0"
-    })
-
+    req = {"model": model, "prompt": prompt, "stream": False, "keep_alive": "10m"}
+    if _MODEL_CTX > 0:
+        # Chunks were sized to the model's full window; without this the
+        # server evaluates under its default num_ctx and silently drops
+        # most of each chunk.
+        req["options"] = {"num_ctx": _MODEL_CTX}
+    body = _json_body(req)
+    conn = _ollama_conn(timeout)
     try:
-        # Use subprocess.run with timeout; avoid .read() blocking
-        res = subprocess.run(
-            [OLLAMA_BIN, "run", model],
-            input=(prompt + "\n").encode("utf-8", errors="ignore"),
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            env=env,
-            timeout=timeout
-        )
-        out = res.stdout.decode("utf-8", errors="ignore")
-        err = res.stderr.decode("utf-8", errors="ignore")
-        text = sanitize(out).strip()
-        if res.returncode != 0:
-            return f"[warn] summarizer exit={res.returncode}\n{sanitize(err)}\n{text}"
+        conn.request("POST", "/api/generate", body, {"Content-Type": "application/json"})
+        resp = conn.getresponse()
+        payload = resp.read()
+        if resp.status != 200:
+            return f"[warn] summarizer HTTP {resp.status}\n{payload.decode('utf-8', 'ignore')[:400]}"
+        out = json.loads(payload).get("response", "")
+        # HTTP responses are pure model text — no TTY, so no ANSI/spinners to
+        # scrub; sanitize() stays reserved for log-file ingestion.
+        text = out.strip()
         return text or "[warn] empty summary"
-    except subprocess.TimeoutExpired as te:
-        partial = te.stdout.decode("utf-8", errors="ignore") if te.stdout else ""
-        return "[warn] summarizer timeout\n" + sanitize(partial)
-
-def chunked(items: list[str], max_chars: int) -> list[str]:
-    chunks, cur = [], []
-    total = 0
-    for s in items:
-        if total + len(s) > max_chars and cur:
-            chunks.append("".join(cur))
-            cur, total = [s], len(s)
-        else:
-            cur.append(s); total += len(s)
-    if cur:
-        chunks.append("".join(cur))
+    except (OSError, http.client.HTTPException, ValueError) as e:
+        # Drop the (possibly wedged) connection; the next call reopens it.
+        try:
+            conn.close()
+        except Exception:
+            pass
+        _conn_local.conn = None
+        return f"[warn] summarizer request failed: {e}"
+
+def adaptive_chunk_size(model: str, default: int) -> int:
+    """
+    Ask /api/show for the model's context window and size chunks to it —
+    a 32k-context summarizer can take ~6x bigger slices, meaning fewer
+    round-trips and less fuse-stage work. Falls back to `default`.
+    """
+    try:
+        conn = http.client.HTTPConnection(OLLAMA_HOST, OLLAMA_PORT, timeout=5)
+        conn.request("POST", "/api/show", _json_body({"name": model}),
+                     {"Content-Type": "application/json"})
+        resp = conn.getresponse()
+        payload = resp.read()
+        conn.close()
+        if resp.status != 200:
+            return default
+        info = json.loads(payload).get("model_info") or {}
+        ctx = 0
+        for k, v in info.items():
+            if k.endswith(".context_length"):
+                ctx = int(v)
+                break
+        if ctx <= 0:
+            return default
+        # Remember the window so ollama_summarize requests the same num_ctx
+        # the chunks are sized for.
+        global _MODEL_CTX
+        _MODEL_CTX = ctx
+        # ~3.5 chars/token, keep ~30% headroom for the instruction prefix
+        # and the response itself.
+        return max(4000, int(ctx * 3.5 * 0.7))
+    except (OSError, ValueError, http.client.HTTPException):
+        return default
+
+def _prune_cache() -> None:
+    """Evict oldest cache entries when the cache exceeds its bytes budget."""
+    try:
+        entries = [(p.stat().st_mtime, p.stat().st_size, p)
+                   for p in CACHE_DIR.glob("*/*") if p.is_file()]
+    except OSError:
+        return
+    total = sum(sz for _, sz, _ in entries)
+    for _, sz, p in sorted(entries):
+        if total <= CACHE_MAX_BYTES:
+            break
+        try:
+            p.unlink()
+            total -= sz
+        except OSError:
+            pass
+
+def summarize_cached(model: str, chunk: str, prompt: str, timeout: int) -> str:
+    """ollama_summarize with an on-disk cache keyed by SHA-256(model, chunk)."""
+    key = hashlib.sha256((model + "\0" + chunk).encode("utf-8", "ignore")).hexdigest()
+    path = CACHE_DIR / key[:2] / key[2:]
+    try:
+        if path.exists():
+            return path.read_text(encoding="utf-8")
+    except OSError:
+        pass
+    text = ollama_summarize(model, prompt, timeout=timeout)
+    if text and not text.startswith(("[warn]", "[fatal]")):
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(path.name + ".tmp")
+            tmp.write_text(text, encoding="utf-8")
+            os.replace(tmp, path)  # atomic: never a half-written cache hit
+        except OSError:
+            pass
+    return text
+
+def chunked(text: str, max_chars: int) -> list[str]:
+    """Slice `text` into ~max_chars chunks cut at newline boundaries.
+    One slice per chunk — no per-line list or intermediate joins."""
+    chunks = []
+    start = 0
+    n = len(text)
+    while n - start > max_chars:
+        cut = text.rfind("\n", start, start + max_chars + 1)
+        if cut <= start:
+            cut = start + max_chars - 1  # single over-long line; hard cut
+        chunks.append(text[start:cut + 1])
+        start = cut + 1
+    if start < n:
+        chunks.append(text[start:])
     return chunks
 
 def simple_fallback_summary(transcript: str, actions: list[str], cap: int = 1600) -> str:
@@ -173,32 +299,41 @@ def simple_fallback_summary(transcript: str, actions: list[str], cap: int = 1600
     )
 
 # ---------- Transcript building ----------
+# The four action patterns fused into one alternation with named groups so the
+# transcript is walked exactly once; dispatch on which group matched.
+_ACTIONS_RE = re.compile(
+    r"\[(?:write|wrote file)[^\]]*\]\s+(?P<write>.+)$"       # files written
+    r"|^\s*(?:\[[^\n\]]+\]\s*)?\$\s+(?P<cmd>.+)$"            # `$` command prompts
+    r"|Ran command:\s+(?P<cmd2>.+)$"                          # explicit variants
+    r"|\[(?:disk|report|size)[^\]]*\]\s+(?P<disk>[^\n]+)",    # disk/telemetry
+    re.I | re.M,
+)
+
 def extract_actions(text: str) -> list[str]:
     actions = []
-    # Files written (case-insensitive), capture the rest of the line
-    for m in re.finditer(r"\[(?:write|wrote file)[^\]]*\]\s+(.+)$", text, re.I | re.M):
-        actions.append(f"WRITE: {m.group(1).strip()}")
-    # Commands executed: match lines that have a `$` command prompt anywhere after a timestamp/prefix
-    for m in re.finditer(r"^\s*(?:\[[^\n\]]+\]\s*)?\$\s+(.+)$", text, re.M):
-        cmd = m.group(1).strip()
-        if cmd:
-            actions.append(f"CMD: {cmd}")
-    # Also capture explicit 'Ran command:' variants anywhere in the line
-    for m in re.finditer(r"Ran command:\s+(.+)$", text, re.I | re.M):
-        actions.append(f"CMD: {m.group(1).strip()}")
-    # Disk reports and similar telemetry
-    for m in re.finditer(r"\[(?:disk|report|size)[^\]]*\]\s+([^\n]+)", text, re.I):
-        actions.append(f"DISK: {m.group(1).strip()}")
+    for m in _ACTIONS_RE.finditer(text):
+        if m.group("write") is not None:
+            actions.append(f"WRITE: {m.group('write').strip()}")
+        elif m.group("cmd") is not None:
+            cmd = m.group("cmd").strip()
+            if cmd:
+                actions.append(f"CMD: {cmd}")
+        elif m.group("cmd2") is not None:
+            actions.append(f"CMD: {m.group('cmd2').strip()}")
+        else:
+            actions.append(f"DISK: {m.group('disk').strip()}")
     return actions[:400]  # slightly higher cap
 
 def build_transcript(logs: dict[str, Path]) -> tuple[str, list[str]]:
     # Prefer creator (rich content); then questioner/mediator; fall back to master
     parts = []
     actions_all = []
-    for key in ("questioner","creator","mediator","master"):
-        p = logs.get(key)
-        if not p: continue
-        t = slurp_clean(p)
+    keys = [k for k in ("questioner","creator","mediator","master") if k in logs]
+    # Each log is an independent read + regex-sweep job; slurp them in
+    # parallel and reassemble in the original key order.
+    with ThreadPoolExecutor(max_workers=4) as ex:
+        texts = list(ex.map(lambda k: slurp_clean(logs[k]), keys))
+    for key, t in zip(keys, texts):
         if not t: continue
         parts.append(f"\n### [{key.upper()}]\n{t}\n")
         actions_all.extend(extract_actions(t))
@@ -237,34 +372,55 @@ def main():
         minimal = simple_fallback_summary(transcript, actions, cap=2000)
         data = minimal.encode("utf-8", errors="ignore")
         if len(data) > MAX_SUMMARY_BYTES:
-            minimal = minimal[:MAX_SUMMARY_BYTES] + "\n\n[truncated]\n"
-        out_path.write_text(minimal, encoding="utf-8")
+            data = data[:MAX_SUMMARY_BYTES] + b"\n\n[truncated]\n"
+        out_path.write_bytes(data)
         print(f"[{ts()}] Wrote summary (no-summarize): {out_path}")
         first_para = minimal.strip().split("\n\n", 1)[0].strip()
         print("\n=== TL;DR ===")
         print(first_para)
         return
 
-    # Chunk transcript to keep summarizer sane
-    items = transcript.splitlines(keepends=True)
-    chunks = chunked(items, CHARS_PER_CHUNK)
+    # Chunk transcript to keep summarizer sane; size chunks to the model's
+    # context window unless the operator pinned SCRIBE_CHUNK_SIZE.
+    chunk_size = CHARS_PER_CHUNK
+    if "SCRIBE_CHUNK_SIZE" not in os.environ:
+        chunk_size = adaptive_chunk_size(args.model, CHARS_PER_CHUNK)
+    chunks = chunked(transcript, chunk_size)
+    _prune_cache()
 
-    print(f"[{ts()}] Prepared {len(chunks)} chunk(s) for summarization (chunk ~{CHARS_PER_CHUNK} chars).")
+    print(f"[{ts()}] Prepared {len(chunks)} chunk(s) for summarization (chunk ~{chunk_size} chars).")
 
-    # Summarize each chunk, then summarize the summaries
-    summaries = []
-    for i, ch in enumerate(chunks, 1):
-        print(f"[{ts()}] Summarizing chunk {i}/{len(chunks)} (timeout {args.timeout}s)...")
-        summaries.append(ollama_summarize(args.model, (
+    # Summarize chunks concurrently (map), then summarize the summaries (reduce).
+    # Ollama takes several in-flight requests when OLLAMA_NUM_PARALLEL allows it.
+    def prompt_for(i: int, ch: str) -> str:
+        return (
             "You are a technical summarizer. Summarize the following log slice into:\n"
             "• Key points (bulleted)\n• Notable actions/commands/files\n• Open questions or TODOs\n"
             "Keep 80–160 words. Focus on signal, drop ANSI/spinners if any remain.\n\n"
             f"== SLICE {i}/{len(chunks)} ==\n{ch}"
-        ), timeout=args.timeout))
-        if not summaries[-1] or summaries[-1].startswith("[warn]"):
+        )
+
+    workers = max(1, min(len(chunks), int(os.environ.get("SCRIBE_PARALLEL", "4"))))
+    print(f"[{ts()}] Summarizing {len(chunks)} chunk(s), {workers} in flight (timeout {args.timeout}s each)...")
+    # Dispatch waves of similar-length chunks: the server batches in-flight
+    # requests together and pads to the longest one, so mixing a tiny chunk
+    # with a huge chunk in the same wave wastes decode slots.
+    order = sorted(range(len(chunks)), key=lambda i: len(chunks[i]))
+    summaries: list[str] = [""] * len(chunks)
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        for w in range(0, len(order), workers):
+            wave = order[w:w + workers]
+            wave_out = ex.map(
+                lambda i: summarize_cached(args.model, chunks[i], prompt_for(i + 1, chunks[i]), args.timeout),
+                wave,
+            )
+            for idx, s in zip(wave, wave_out):
+                summaries[idx] = s
+    for i, s in enumerate(summaries, 1):
+        if not s or s.startswith("[warn]"):
             print(f"[{ts()}]  ↳ chunk {i} fell back / warn.")
         else:
-            print(f"[{ts()}]  ↳ chunk {i} ok ({len(summaries[-1])} chars).")
+            print(f"[{ts()}]  ↳ chunk {i} ok ({len(s)} chars).")
 
     if len(chunks) == 0 or all((not s) or s.startswith("[warn]") for s in summaries):
         print(f"[{ts()}] Summaries unavailable; using local fallback.")
@@ -286,11 +442,12 @@ def main():
 
     print(f"[{ts()}] Chunks: {len(chunks)}  Model: {args.model}  Timeout/chunk: {args.timeout}s")
     out_path = run_dir / "summary.md"
+    # Encode once: guard and truncate on the bytes, then write them directly.
     data = final.encode("utf-8", errors="ignore")
     if len(data) > MAX_SUMMARY_BYTES:
-        final = final[:MAX_SUMMARY_BYTES] + "\n\n[truncated to protect disk]\n"
+        data = data[:MAX_SUMMARY_BYTES] + b"\n\n[truncated to protect disk]\n"
 
-    out_path.write_text(final, encoding="utf-8")
+    out_path.write_bytes(data)
     print(f"[{ts()}] Wrote summary: {out_path}")
     print("\n=== TL;DR ===")
     # print first paragraph as a quick TL;DR
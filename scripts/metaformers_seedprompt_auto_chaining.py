@@ -19,6 +19,9 @@ Metaformers — seed prompt auto-chaining (v2)
     * Designed to avoid spinner/ANSI/braille clutter and "Thinking..." blocks.
 """
 
+import asyncio
+import atexit
+import math
 import os
 import sys
 import json
@@ -34,6 +37,28 @@ except Exception as e:
     print("[fatal] This script requires `requests` (pip install requests).")
     sys.exit(1)
 
+try:
+    import cache as response_cache  # sibling scripts/cache.py
+except Exception:
+    response_cache = None
+
+# orjson decodes the per-token stream chunks ~2-5x faster than stdlib json;
+# entirely optional.
+try:
+    import orjson
+
+    def _json_dumps(obj) -> bytes:
+        return orjson.dumps(obj)
+
+    _json_loads = orjson.loads
+except ImportError:
+    def _json_dumps(obj) -> bytes:
+        return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+    _json_loads = json.loads
+
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
 # -----------------------------
 # Config / defaults (env override)
 # -----------------------------
@@ -48,49 +73,187 @@ GEN_OPTIONS = {
     "top_p": float(os.getenv("GEN_TOP_P", "0.9")),
 }
 
+# Per-role decode budgets: decoding is the dominant cost, so cap each role at
+# what its format actually needs. The Questioner/Mediator emit one line, the
+# Scriber <=300 chars, and the Creator stops once its plan (which ends at the
+# NextPrompt line) trails off into repeated blank lines. num_ctx stays modest
+# but leaves headroom for the KV context carried across turns.
+QUESTIONER_OPTS = {**GEN_OPTIONS, "num_predict": 64, "stop": ["\n"], "num_ctx": 4096}
+CREATOR_OPTS    = {**GEN_OPTIONS, "num_predict": 512, "stop": ["\n\n\n"]}
+MEDIATOR_OPTS   = {"temperature": 0.2, "top_p": 0.9, "num_predict": 96, "stop": ["\n"], "num_ctx": 4096}
+SCRIBER_OPTS    = {"temperature": 0.2, "top_p": 0.9, "num_predict": 128, "num_ctx": 4096}
+
+# Keep models resident between calls; the 4 role calls per turn all reuse it.
+KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+
+# On-disk response cache: identical (model, system, prompt, options) calls
+# skip inference entirely. Set CACHE_RESPONSES=0 to always regenerate.
+CACHE_RESPONSES = os.getenv("CACHE_RESPONSES", "1") != "0" and response_cache is not None
+
+# Semantic router: when the Creator output barely moved from the previous
+# turn (cosine similarity above the threshold), the Mediator and Scriber
+# calls add nothing and are skipped. EMBED_MODEL="" disables the router.
+EMBED_MODEL   = os.getenv("EMBED_MODEL", "nomic-embed-text")
+SEMANTIC_SKIP = float(os.getenv("SEMANTIC_SKIP", "0.97"))
+
+# One pooled session for the whole run: reusing the loopback connection skips
+# a TCP handshake on every one of the 4 model calls per turn.
+SESSION = requests.Session()
+SESSION.mount("http://", requests.adapters.HTTPAdapter(pool_connections=8, pool_maxsize=8))
+
 # -----------------------------
 # Utilities
 # -----------------------------
-def ts():
-    return datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+# ts() runs on every log header; the formatted string only changes once per
+# second, so cache it and re-format only when the second ticks over.
+_ts_last_sec = -1
+_ts_last_str = ""
 
-ANSI_RE = re.compile(r"\x1B\[[0-?]*[ -/]*[@-~]")
-BRAILLE_RE = re.compile(r"[\u2800-\u28FF]+", re.UNICODE)
-THINK_BLOCK_RE = re.compile(r"(?is)\bthinking\.\.\..*?(?:done thinking\.)")
+def ts():
+    global _ts_last_sec, _ts_last_str
+    s = time.time_ns() // 1_000_000_000
+    if s != _ts_last_sec:
+        _ts_last_sec = s
+        _ts_last_str = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(s))
+    return _ts_last_str
+
+# ANSI escapes, braille spinners, and 'Thinking.../done thinking' blocks
+# fused into one alternation so sanitize walks the string once, not thrice.
+_CLEAN_RE = re.compile(
+    r"\x1B\[[0-?]*[ -/]*[@-~]"
+    r"|[\u2800-\u28FF]+"
+    r"|(?is:\bthinking\.\.\..*?done thinking\.)"
+)
 
 def sanitize(text: str) -> str:
     """Strip ANSI, braille spinners, and 'Thinking.../done thinking' blocks."""
     if not text:
         return text
-    text = ANSI_RE.sub("", text)
-    text = BRAILLE_RE.sub("", text)
-    text = THINK_BLOCK_RE.sub("", text)
-    return text.strip()
+    return _CLEAN_RE.sub("", text).strip()
 
 def ensure_dir(p: Path):
     p.mkdir(parents=True, exist_ok=True)
 
+# Last returned `context` token array per (model, system) pair. Feeding it
+# back lets Ollama reuse the KV cache for the shared system prompt instead of
+# re-prefilling the same few hundred tokens on every turn; the system prompt
+# itself is only sent on the first call per pair.  Keying on the system too
+# keeps roles that share a model (Mediator and Scriber both default to
+# dolphin3) from resuming each other's conversation under the wrong persona.
+_contexts = {}
+
 def call_ollama(model: str, prompt: str, system: str = None, options: dict = None, timeout: int = 120) -> str:
-    """Call Ollama /api/generate non-streaming; returns the 'response' field text."""
+    """Call Ollama /api/generate streaming over the shared session; returns the full response text."""
+    ctx_key = (model, system or "")
+    # Cache only context-free calls: once a KV context is fed back it
+    # conditions the generation but is not part of the key, so a hit would
+    # return text from a different chain state — and skip the stream loop
+    # that advances _contexts, freezing the chain.
+    cacheable = CACHE_RESPONSES and _contexts.get(ctx_key) is None
+    if cacheable:
+        cache_key = response_cache.make_key(model, prompt, system or "", options)
+        hit = response_cache.get(cache_key)
+        if hit is not None:
+            return hit
     url = f"{OLLAMA_HOST}/api/generate"
-    payload = {"model": model, "prompt": prompt, "stream": False}
-    if system:
+    payload = {"model": model, "prompt": prompt, "stream": True, "keep_alive": KEEP_ALIVE}
+    ctx = _contexts.get(ctx_key)
+    if ctx is not None:
+        payload["context"] = ctx
+    elif system:
         payload["system"] = system
     if options:
         payload["options"] = options
     try:
-        r = requests.post(url, json=payload, timeout=timeout)
+        r = SESSION.post(url, data=_json_dumps(payload), headers=_JSON_HEADERS,
+                         stream=True, timeout=timeout)
         r.raise_for_status()
-        data = r.json()
-        return data.get("response", "")
+        # Streaming accumulates the response as it's generated and releases
+        # the pooled connection as soon as the final "done" chunk lands.
+        chunks = []
+        for line in r.iter_lines(chunk_size=4096):
+            if not line:
+                continue
+            piece = _json_loads(line)
+            chunks.append(piece.get("response", ""))
+            if piece.get("done"):
+                if piece.get("context"):
+                    _contexts[ctx_key] = piece["context"]
+                break
+        out = "".join(chunks)
+        if cacheable and out:
+            response_cache.put(cache_key, out)
+        return out
     except requests.HTTPError as e:
         return f"[model error] {e}"
     except Exception as e:
         return f"[model error] {e}"
 
+async def acall_ollama(model: str, prompt: str, system: str = None, options: dict = None, timeout: int = 120) -> str:
+    """Async wrapper over call_ollama (shared session runs in a worker thread)."""
+    return await asyncio.to_thread(call_ollama, model, prompt, system=system, options=options, timeout=timeout)
+
+def embed_text(text: str):
+    """Embed via /api/embeddings; returns the vector or None when unavailable."""
+    if not EMBED_MODEL:
+        return None
+    try:
+        r = SESSION.post(
+            f"{OLLAMA_HOST}/api/embeddings",
+            data=_json_dumps({"model": EMBED_MODEL, "prompt": text, "keep_alive": KEEP_ALIVE}),
+            headers=_JSON_HEADERS,
+            timeout=30,
+        )
+        r.raise_for_status()
+        return _json_loads(r.content).get("embedding") or None
+    except Exception:
+        return None
+
+def cosine(a, b) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    na = math.sqrt(sum(x * x for x in a))
+    nb = math.sqrt(sum(y * y for y in b))
+    return dot / (na * nb) if na and nb else 0.0
+
+def _warm_ping(model: str):
+    # Empty prompt = pure weight load; bypasses the response cache and the
+    # per-model context so the first real call still sends its system prompt.
+    try:
+        SESSION.post(
+            f"{OLLAMA_HOST}/api/generate",
+            data=_json_dumps({"model": model, "prompt": "", "stream": False, "keep_alive": KEEP_ALIVE}),
+            headers=_JSON_HEADERS,
+            timeout=300,
+        )
+    except Exception:
+        pass
+
+async def warm_models(*models: str):
+    """Load all role models concurrently so cold-start cost is paid once, overlapped."""
+    unique = list(dict.fromkeys(models))
+    await asyncio.gather(*(asyncio.to_thread(_warm_ping, m) for m in unique))
+
+# Open log handles are kept for the whole run: the old open/write/close per
+# line cost 3 syscalls for every one of the 8+ writes per turn. Buffered
+# handles get flushed once per turn instead.
+_LOG_HANDLES = {}
+
 def write(logfile: Path, text: str):
-    with logfile.open("a", encoding="utf-8") as f:
-        f.write(text)
+    fh = _LOG_HANDLES.get(logfile)
+    if fh is None:
+        fh = _LOG_HANDLES[logfile] = logfile.open("a", encoding="utf-8", buffering=1 << 16)
+    fh.write(text)
+
+def tee(master: Path, turn: Path, text: str):
+    """Write one pre-formatted block to both the master and the turn log."""
+    write(master, text)
+    write(turn, text)
+
+def flush_logs():
+    for fh in _LOG_HANDLES.values():
+        fh.flush()
+
+atexit.register(flush_logs)
 
 def header(line: str) -> str:
     return f"\n[{ts()}] {line}\n"
@@ -146,11 +309,15 @@ def extract_next_prompt(text: str) -> str:
     """Find the last NextPrompt: line in the Creator output."""
     if not text:
         return ""
-    m = None
-    for m in NEXTPROMPT_RE.finditer(text):
-        pass
-    if m:
-        return m.group(1).strip()
+    # Scan backwards from the end instead of regex-iterating every match just
+    # to keep the last one; the anchored regex still validates the line.
+    low = text.lower()
+    idx = low.rfind("nextprompt")
+    while idx != -1:
+        m = NEXTPROMPT_RE.match(text, text.rfind("\n", 0, idx) + 1)
+        if m:
+            return m.group(1).strip()
+        idx = low.rfind("nextprompt", 0, idx)
     return ""
 
 def fallback_next_prompt(prev_creator: str, topic_now: str) -> str:
@@ -160,7 +327,7 @@ def fallback_next_prompt(prev_creator: str, topic_now: str) -> str:
 # -----------------------------
 # Main loop
 # -----------------------------
-def main():
+async def main():
     print("Metaformers — seed prompt auto-chaining")
     topic = input("First prompt (what should they discuss?): ").strip()
     if not topic:
@@ -176,6 +343,12 @@ def main():
     except:
         mediator_every = 0
 
+    # Load every role model up front, in parallel: cold-start weight loads
+    # (seconds for the Creator) overlap each other instead of serializing
+    # inside the first turn. keep_alive keeps them resident afterwards.
+    print("[info] Warming models…")
+    await warm_models(MODEL_QUESTIONER, MODEL_CREATOR, MODEL_MEDIATOR, MODEL_SCRIBER)
+
     run_id = datetime.now().strftime("%Y%m%d-%H%M%S")
     run_dir = Path("runs") / run_id
     logs_dir = run_dir / "logs"
@@ -188,95 +361,159 @@ def main():
     write(master_log, f"Params: turns={turns} mediator_every={mediator_every}\n")
     write(master_log, "-" * 80 + "\n")
 
-    last_creator_out = ""
+    last_creator_tail = ""
 
-    for t in range(1, turns + 1):
-        turn_log = logs_dir / f"turn_{t:03d}.log"
-        write(master_log, header(f"=== Turn {t}/{turns} ==="))
-        write(turn_log, header(f"=== Turn {t}/{turns} ==="))
+    # The Scriber only summarizes turn t; it has no bearing on turn t+1's
+    # Questioner, so it runs as a background task overlapped with the next
+    # turn (Ollama interleaves the two when OLLAMA_NUM_PARALLEL >= 2).
+    os.environ.setdefault("OLLAMA_NUM_PARALLEL", "2")
 
-        # 1) Questioner
-        q_prompt = topic
-        q_out = call_ollama(
+    # Semantic-router state: previous Creator embedding plus the last
+    # Mediator/Scriber outputs to reuse on near-duplicate turns.
+    prev_creator_emb = None
+    semantic_dup = False
+    last_mediator_line = ""
+    last_s_out = ""
+
+    async def run_scriber(corrected_topic: str, creator_tail: str, turn_log: Path):
+        nonlocal last_s_out
+        s_prompt = f"Topic: {corrected_topic}\n\nCreator:\n{creator_tail}"
+        s_out = await acall_ollama(
+            MODEL_SCRIBER,
+            prompt=s_prompt,
+            system=SCRIBER_SYS,
+            options=SCRIBER_OPTS
+        )
+        s_out = sanitize(s_out)
+        last_s_out = s_out
+        tee(master_log, turn_log, f"[{MODEL_SCRIBER}] <<<\n{s_out}\n\n")
+
+    scriber_task = None
+    pending_questioner = None  # prefetched at the end of the previous turn
+
+    def questioner_task(for_topic: str):
+        return asyncio.ensure_future(acall_ollama(
             MODEL_QUESTIONER,
-            prompt=q_prompt,
+            prompt=for_topic,
             system=QUESTIONER_SYS,
-            options=GEN_OPTIONS
-        )
+            options=QUESTIONER_OPTS
+        ))
+
+    for t in range(1, turns + 1):
+        turn_started = time.perf_counter()
+        turn_log = logs_dir / f"turn_{t:03d}.log"
+        tee(master_log, turn_log, header(f"=== Turn {t}/{turns} ==="))
+
+        # 1) Questioner — usually already in flight, prefetched right after
+        # the previous turn's NextPrompt was extracted, so it overlapped with
+        # that turn's Scriber and log writes.
+        q_task = pending_questioner if pending_questioner is not None else questioner_task(topic)
+        pending_questioner = None
+        if scriber_task is not None:
+            await scriber_task
+            scriber_task = None
+        q_out = await q_task
         q_out = sanitize(q_out)
-        write(master_log, f"[{MODEL_QUESTIONER}] <<<\n{q_out}\n\n")
-        write(turn_log,      f"[{MODEL_QUESTIONER}] <<<\n{q_out}\n\n")
+        tee(master_log, turn_log, f"[{MODEL_QUESTIONER}] <<<\n{q_out}\n\n")
 
         corrected_topic = q_out if q_out else topic
 
         # 2) Mediator (optional)
         mediator_line = ""
-        if mediator_every and (t % mediator_every == 0):
-            med_prompt = f"Topic:\n{corrected_topic}\n\nLastCreator:\n{last_creator_out[-2000:]}"
-            med_out = call_ollama(
+        if mediator_every and (t % mediator_every == 0) and semantic_dup and last_mediator_line:
+            # The Creator barely moved last turn; re-raise the same critique
+            # instead of paying for a fresh Mediator call.
+            mediator_line = last_mediator_line
+            tee(master_log, turn_log, f"[{MODEL_MEDIATOR}] <<< [skipped: semantic-dup]\n{mediator_line}\n\n")
+        elif mediator_every and (t % mediator_every == 0):
+            med_prompt = f"Topic:\n{corrected_topic}\n\nLastCreator:\n{last_creator_tail}"
+            med_out = await acall_ollama(
                 MODEL_MEDIATOR,
                 prompt=med_prompt,
                 system=MEDIATOR_SYS,
-                options={"temperature": 0.2, "top_p": 0.9}
+                options=MEDIATOR_OPTS
             )
             med_out = sanitize(med_out)
-            write(master_log, f"[{MODEL_MEDIATOR}] <<<\n{med_out}\n\n")
-            write(turn_log,      f"[{MODEL_MEDIATOR}] <<<\n{med_out}\n\n")
+            tee(master_log, turn_log, f"[{MODEL_MEDIATOR}] <<<\n{med_out}\n\n")
             # Expect exactly: "MediatorQ: ..."
             if med_out.lower().startswith("mediatorq:"):
                 mediator_line = med_out.strip()
             elif "MediatorQ:" in med_out:
                 mediator_line = med_out.split("MediatorQ:", 1)[1].strip()
                 mediator_line = "MediatorQ: " + mediator_line
+        if mediator_line:
+            last_mediator_line = mediator_line
 
         # 3) Creator
         creator_prompt = f"Topic: {corrected_topic}"
         if mediator_line:
             creator_prompt += f"\n\n{mediator_line}\n(Answer the Mediator's question directly within the plan above.)"
 
-        c_out = call_ollama(
+        c_out = await acall_ollama(
             MODEL_CREATOR,
             prompt=creator_prompt,
             system=CREATOR_SYS,
-            options=GEN_OPTIONS
+            options=CREATOR_OPTS
         )
         c_out = sanitize(c_out)
-        write(master_log, f"[{MODEL_CREATOR}] <<<\n{c_out}\n\n")
-        write(turn_log,      f"[{MODEL_CREATOR}] <<<\n{c_out}\n\n")
-        last_creator_out = c_out
-
-        # 4) Scriber
-        s_prompt = f"Topic: {corrected_topic}\n\nCreator:\n{c_out[-2400:]}"
-        s_out = call_ollama(
-            MODEL_SCRIBER,
-            prompt=s_prompt,
-            system=SCRIBER_SYS,
-            options={"temperature": 0.2, "top_p": 0.9}
+        tee(master_log, turn_log, f"[{MODEL_CREATOR}] <<<\n{c_out}\n\n")
+
+        # Sliced once per turn: the same line-aligned tail feeds both this
+        # turn's Scriber and the next mediator turn, so neither prompt ever
+        # starts mid-line (or mid-codepoint) and prefill length stays bounded.
+        creator_tail = "\n".join(c_out.rsplit("\n", 30)[-30:])[-2400:]
+        last_creator_tail = creator_tail
+
+        # Semantic router: compare this Creator output against the previous
+        # one; on a near-duplicate, the Scriber (and next mediator turn)
+        # reuse their previous outputs instead of generating again.
+        emb = embed_text(creator_tail)
+        semantic_dup = (
+            emb is not None
+            and prev_creator_emb is not None
+            and cosine(emb, prev_creator_emb) >= SEMANTIC_SKIP
         )
-        s_out = sanitize(s_out)
-        write(master_log, f"[{MODEL_SCRIBER}] <<<\n{s_out}\n\n")
-        write(turn_log,      f"[{MODEL_SCRIBER}] <<<\n{s_out}\n\n")
+        if emb is not None:
+            prev_creator_emb = emb
+
+        # 4) Scriber — fire-and-overlap; joined at the top of the next turn
+        if semantic_dup and last_s_out:
+            tee(master_log, turn_log, f"[{MODEL_SCRIBER}] <<< [skipped: semantic-dup]\n{last_s_out}\n\n")
+        else:
+            scriber_task = asyncio.ensure_future(run_scriber(corrected_topic, creator_tail, turn_log))
 
         # 5) Next topic
         next_topic = extract_next_prompt(c_out)
         if not next_topic:
             next_topic = fallback_next_prompt(c_out, corrected_topic)
 
-        write(master_log, f"NextTopic -> {next_topic}\n" + ("-" * 80) + "\n")
-        write(turn_log,   f"NextTopic -> {next_topic}\n" + ("-" * 80) + "\n")
+        tee(master_log, turn_log, f"NextTopic -> {next_topic}\n" + ("-" * 80) + "\n")
 
-        # Chain
+        # Chain — and prefetch the next Questioner immediately so it runs
+        # while the Scriber and log flush finish out this turn.
         topic = next_topic
+        if t < turns:
+            pending_questioner = questioner_task(topic)
+
+        flush_logs()
+
+        # Only pause when a turn completed suspiciously fast (cache hits /
+        # model errors); normal turns take seconds and shouldn't pay a fixed
+        # 200 ms tax on top. asyncio.sleep keeps the prefetched tasks moving.
+        elapsed = time.perf_counter() - turn_started
+        if elapsed < 0.5:
+            await asyncio.sleep(0.5 - elapsed)
 
-        # Be nice to CPU / logs
-        time.sleep(0.2)
+    # Don't drop the final turn's summary
+    if scriber_task is not None:
+        await scriber_task
 
     print(f"[done] Run folder: {run_dir}")
     print("Tip: tail -f {}/master.log".format(run_dir))
 
 if __name__ == "__main__":
     try:
-        main()
+        asyncio.run(main())
     except KeyboardInterrupt:
         print("\n[abort] Interrupted by user.")
         sys.exit(130)
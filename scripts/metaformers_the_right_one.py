@@ -15,19 +15,43 @@ Models assumed (adjust names if your tags differ):
   - Judge:       llama2-uncensored:latest
 """
 
-import json, os, sys, time, subprocess, datetime, textwrap, shutil
+import json, os, re, sys, time, datetime, textwrap
 from typing import Tuple, Optional
 
+try:
+    import requests
+except Exception:
+    print("[fatal] This script requires `requests` (pip install requests).", file=sys.stderr)
+    sys.exit(3)
+
+# orjson serializes the jsonl log records and Ollama payloads ~2-5x faster
+# than stdlib json; entirely optional.
+try:
+    import orjson
+
+    def _json_dumps(obj) -> bytes:
+        return orjson.dumps(obj)
+
+    _json_loads = orjson.loads
+except ImportError:
+    def _json_dumps(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    _json_loads = json.loads
+
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
 # ------------------------- Config -------------------------
 QUESTIONER = os.environ.get("MOAI_QUESTIONER", "llama2-uncensored:latest")
 CREATOR    = os.environ.get("MOAI_CREATOR",    "gpt-oss:20b")
 MEDIATOR   = os.environ.get("MOAI_MEDIATOR",   "dolphin3:latest")
 JUDGE      = os.environ.get("MOAI_JUDGE",      "llama2-uncensored:latest")
 
-OLLAMA_BIN = os.environ.get("OLLAMA_BIN", "/usr/local/bin/ollama")
+OLLAMA_HOST = os.environ.get("OLLAMA_HOST", "http://127.0.0.1:11434")
 
 ITERATIONS       = int(os.environ.get("MOAI_ITER", "6"))
 MEDIATOR_EVERY   = int(os.environ.get("MOAI_MEDIATOR_EVERY", "3"))
+JUDGE_BATCH      = int(os.environ.get("MOAI_JUDGE_BATCH", "4"))  # score every N iterations in one call
 TIMEOUT_SECONDS  = int(os.environ.get("MOAI_TIMEOUT", "120"))  # per model call
 MAX_TOKENS_PRINT = 4000  # safe guard for logs
 
@@ -44,43 +68,54 @@ SEED_PROMPT = (
 )
 
 # ------------------------- Helpers -------------------------
-def now_iso() -> str:
-    return datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+# now_iso() runs on every plog record; second-resolution output only changes
+# once per second, so re-format only when the second ticks over.
+_now_last_sec = -1
+_now_last_str = ""
 
-def ensure_ollama() -> None:
-    if not shutil.which(OLLAMA_BIN):
-        print(f"[{now_iso()}] [fatal] ollama not found at: {OLLAMA_BIN}", file=sys.stderr)
-        sys.exit(3)
+def now_iso() -> str:
+    global _now_last_sec, _now_last_str
+    s = time.time_ns() // 1_000_000_000
+    if s != _now_last_sec:
+        _now_last_sec = s
+        _now_last_str = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(s))
+    return _now_last_str
+
+# Shared session: one pooled loopback connection for all role calls, and
+# keep_alive keeps each model's weights resident between iterations instead
+# of paying a reload inside a fresh `ollama run` subprocess.
+SESSION = requests.Session()
 
 def ollama_run(model: str, prompt: str, timeout: int = TIMEOUT_SECONDS) -> str:
-    """Run `ollama run <model>` with prompt on stdin; return stdout text."""
+    """POST to the Ollama HTTP API; return the generated text."""
     try:
-        proc = subprocess.run(
-            [OLLAMA_BIN, "run", model],
-            input=prompt.encode("utf-8"),
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            timeout=timeout
+        r = SESSION.post(
+            f"{OLLAMA_HOST}/api/generate",
+            data=_json_dumps({"model": model, "prompt": prompt, "stream": False, "keep_alive": "30m"}),
+            headers=_JSON_HEADERS,
+            timeout=timeout,
         )
-        out = proc.stdout.decode("utf-8", errors="replace")
-        err = proc.stderr.decode("utf-8", errors="replace")
-        if proc.returncode != 0:
-            return f"[model_error rc={proc.returncode}] {err.strip() or out.strip()}"
-        return out
-    except subprocess.TimeoutExpired:
+        r.raise_for_status()
+        return _json_loads(r.content).get("response", "")
+    except requests.Timeout:
         return "[model_error timeout]"
+    except Exception as e:
+        return f"[model_error] {e}"
 
 def clip(s: str, n: int = MAX_TOKENS_PRINT) -> str:
     return s if len(s) <= n else s[:n] + "\n[...truncated...]"
 
 def plog(fh, event: str, **kv):
+    # No per-record flush: the log handle is flushed once per iteration,
+    # which drops the syscall count on the logging path by ~10x.
     rec = {"ts": now_iso(), "event": event, **kv}
-    fh.write(json.dumps(rec, ensure_ascii=False) + "\n")
-    fh.flush()
+    fh.write(_json_dumps(rec).decode("utf-8"))
+    fh.write("\n")
 
 # ------------------------- Prompt Templates -------------------------
-def prompt_questioner(seed: str) -> str:
-    return textwrap.dedent(f"""
+# dedent() rescans its literal on every call; the templates are static, so
+# dedent once at import and only do the cheap .format substitution per call.
+_Q_TMPL = textwrap.dedent("""
     You are the Questioner. Starting from the goal below, propose 5 candidate RIGHT QUESTIONS (one line each).
 
     Goal:
@@ -95,8 +130,7 @@ def prompt_questioner(seed: str) -> str:
     Return only the 5 questions as a numbered list (1–5), nothing else.
     """).strip()
 
-def prompt_creator(list_5: str) -> str:
-    return textwrap.dedent(f"""
+_C_TMPL = textwrap.dedent("""
     You are the Creator. You will refine the Questioner’s 5 candidates and pick the top 3.
 
     Candidates:
@@ -110,8 +144,7 @@ def prompt_creator(list_5: str) -> str:
     Return EXACTLY 3 blocks in the above format, separated by blank lines. No extra commentary.
     """).strip()
 
-def prompt_mediator(creator_blocks: str) -> str:
-    return textwrap.dedent(f"""
+_M_TMPL = textwrap.dedent("""
     You are the Mediator. Challenge assumptions and improve wording.
 
     Review:
@@ -123,8 +156,7 @@ def prompt_mediator(creator_blocks: str) -> str:
     Revised: <question line>
     """).strip()
 
-def prompt_judge(questions_block: str) -> str:
-    return textwrap.dedent(f"""
+_J_TMPL = textwrap.dedent("""
     You are the Judge. Score each question (or revised one) for:
     - clarity (0–10)
     - testability (0–10)
@@ -135,71 +167,117 @@ def prompt_judge(questions_block: str) -> str:
     {questions_block}
     """).strip()
 
+def prompt_questioner(seed: str) -> str:
+    return _Q_TMPL.format(seed=seed)
+
+def prompt_creator(list_5: str) -> str:
+    return _C_TMPL.format(list_5=list_5)
+
+def prompt_mediator(creator_blocks: str) -> str:
+    return _M_TMPL.format(creator_blocks=creator_blocks)
+
+def prompt_judge(questions_block: str) -> str:
+    return _J_TMPL.format(questions_block=questions_block)
+
 # ------------------------- Parsing -------------------------
+# matches "1. ..." / "12) ..." at line start, capturing the question text
+_NUM_RE = re.compile(r"(?m)^\s*\d+[.)]\s*(.+?)\s*$")
+
 def extract_numbered(lines: str) -> list:
-    out = []
-    for ln in lines.splitlines():
-        ln = ln.strip()
-        if not ln:
-            continue
-        # match "1. ..." or "1) ..."
-        if len(ln) > 2 and (ln[0].isdigit() and ln[1] in [')', '.']) :
-            # strip "1. " or "1) "
-            out.append(ln[2:].strip(" -"))
-        else:
-            # also accept bare lines if exactly 5 lines were returned
-            out.append(ln)
-    # keep at most 5 distinct non-empty lines
-    dedup = []
-    for q in out:
-        if q and q not in dedup:
-            dedup.append(q)
-        if len(dedup) >= 5:
+    """Pull up to 5 distinct numbered items; fall back to bare lines."""
+    seen, out = set(), []
+    for q in _NUM_RE.findall(lines):
+        q = q.strip(" -")
+        if q and q not in seen:
+            seen.add(q)
+            out.append(q)
+        if len(out) == 5:
             break
-    return dedup
+    if out:
+        return out
+    # no numbered list — accept bare non-empty lines instead
+    return [ln.strip() for ln in lines.splitlines() if ln.strip()][:5]
+
+# One C-level scan instead of split("\n\n") + three startswith checks per
+# line. The lone \s* between fields may cross blank lines but cannot jump
+# over content, so a Rationale/Micro-test line only binds to the Q directly
+# above it.
+_BLOCK_RE = re.compile(
+    r"^[ \t]*Q:[ \t]*(?P<q>.+?)[ \t]*$"
+    r"(?:\s*^[ \t]*Rationale:[ \t]*(?P<r>.+?)[ \t]*$)?"
+    r"(?:\s*^[ \t]*Micro-test:[ \t]*(?P<m>.+?)[ \t]*$)?",
+    re.I | re.M,
+)
+
+_MED_RE = re.compile(
+    r"^[ \t]*(?:Meta:[ \t]*(?P<meta>.+?)|Revised:[ \t]*(?P<rev>.+?))[ \t]*$",
+    re.I | re.M,
+)
+
+_JSON_DECODER = json.JSONDecoder()
 
 def parse_creator_blocks(txt: str) -> list:
     """Return list of dicts: [{'q':..., 'rationale':..., 'micro':...}, ...]"""
-    blocks = [b.strip() for b in txt.strip().split("\n\n") if b.strip()]
-    out = []
-    for b in blocks:
-        q = r = m = ""
-        for ln in b.splitlines():
-            s = ln.strip()
-            if s.lower().startswith("q:"):
-                q = s[2:].strip()
-            elif s.lower().startswith("rationale:"):
-                r = s[len("rationale:"):].strip()
-            elif s.lower().startswith("micro-test:"):
-                m = s[len("micro-test:"):].strip()
-        if q:
-            out.append({"q": q, "rationale": r, "micro": m})
+    out = [
+        {"q": m.group("q"), "rationale": m.group("r") or "", "micro": m.group("m") or ""}
+        for m in _BLOCK_RE.finditer(txt)
+    ]
     return out[:3]
 
 def parse_mediator(txt: str) -> Tuple[Optional[str], Optional[str]]:
     meta, rev = None, None
-    for ln in txt.splitlines():
-        s = ln.strip()
-        if s.lower().startswith("meta:"):
-            meta = s[5:].strip()
-        elif s.lower().startswith("revised:"):
-            rev = s[8:].strip()
+    for m in _MED_RE.finditer(txt):
+        if m.group("meta") is not None:
+            meta = m.group("meta")
+        else:
+            rev = m.group("rev")
     return meta, rev
 
+def flush_judge(pending: list, log) -> dict:
+    """Score every pending iteration's questions in ONE Judge call.
+
+    `pending` is a list of (iteration, [questions]). Each question is sent
+    with an "ItN-QM:" id prefix so scores can be routed back per iteration.
+    Returns {iteration: (best_question, best_total)} for scored entries.
+    """
+    lines, index = [], {}
+    for it, qs in pending:
+        for j, q in enumerate(qs, 1):
+            qid = f"It{it}-Q{j}"
+            index[qid] = (it, q)
+            lines.append(f"{qid}: {q}")
+    j_prompt = prompt_judge("\n".join(lines))
+    j_out = ollama_run(JUDGE, j_prompt)
+    plog(log, "judge_raw", batch=[it for it, _ in pending], out=clip(j_out))
+
+    picks = {}
+    for sc in parse_judge_json(j_out):
+        qtext = sc.get("q") or sc.get("question") or ""
+        qid = qtext.split(":", 1)[0].strip()
+        if qid not in index:
+            continue
+        it, q = index[qid]
+        t = int(sc.get("total", 0))
+        if it not in picks or t > picks[it][1]:
+            picks[it] = (q, t)
+    return picks
+
 def parse_judge_json(txt: str) -> list:
-    try:
-        start = txt.find("[")
-        end = txt.rfind("]")
-        if start == -1 or end == -1:
-            return []
-        return json.loads(txt[start:end+1])
-    except Exception:
-        return []
+    # raw_decode parses the first well-formed array in place, instead of the
+    # old find('[')..rfind(']') slice that broke on any trailing ']' chatter.
+    idx = txt.find("[")
+    while idx != -1:
+        try:
+            val, _ = _JSON_DECODER.raw_decode(txt, idx)
+            if isinstance(val, list):
+                return val
+        except ValueError:
+            pass
+        idx = txt.find("[", idx + 1)
+    return []
 
 # ------------------------- Main Loop -------------------------
 def main():
-    ensure_ollama()
-
     run_id = datetime.datetime.utcnow().strftime("%Y%m%d-%H%M%S")
     root = os.getcwd()
     outdir = os.path.join(root, "moai_runs", run_id)
@@ -213,6 +291,9 @@ def main():
         current_seed = SEED_PROMPT
         plog(log, "start", run_id=run_id, questioner=QUESTIONER, creator=CREATOR, mediator=MEDIATOR, judge=JUDGE)
 
+        pending_judge = []   # [(iteration, [questions])] awaiting a batched Judge call
+        last_best_q = ""
+
         for it in range(1, ITERATIONS+1):
             plog(log, "iteration_begin", i=it)
 
@@ -247,30 +328,26 @@ def main():
                 if revised:
                     revised_q = revised
 
-            # 4) Judge — score all (3 + revised if present)
-            scoring_block = "\n".join([b["q"] for b in top3])
+            # 4) Judge — batched: one scoring call every JUDGE_BATCH
+            # iterations amortizes the Judge's fixed prefill N-fold.
+            questions = [b["q"] for b in top3]
             if revised_q:
-                scoring_block += "\n" + revised_q
-
-            j_prompt = prompt_judge(scoring_block)
-            j_out = ollama_run(JUDGE, j_prompt)
-            plog(log, "judge_raw", i=it, out=clip(j_out))
-
-            scores = parse_judge_json(j_out)
-            # pick best by total; fallback to first
-            best_q = top3[0]["q"]
-            best_total = -1
-            for sc in scores:
-                t = int(sc.get("total", 0))
-                q = sc.get("q") or sc.get("question") or ""
-                if t > best_total and q:
-                    best_total = t
-                    best_q = q
-
-            # append to best file
-            best.write(f"[{now_iso()}] Iter {it}: {best_q}\n")
-            best.flush()
-            plog(log, "iteration_choice", i=it, best_question=best_q, judged_total=best_total)
+                questions.append(revised_q)
+            pending_judge.append((it, questions))
+
+            if it % JUDGE_BATCH == 0 or it == ITERATIONS:
+                picks = flush_judge(pending_judge, log)
+                for jit, qs in pending_judge:
+                    bq, bt = picks.get(jit, (qs[0], -1))
+                    best.write(f"[{now_iso()}] Iter {jit}: {bq}\n")
+                    plog(log, "iteration_choice", i=jit, best_question=bq, judged_total=bt)
+                best.flush()
+                last_best_q = picks.get(it, (questions[0], -1))[0]
+                pending_judge = []
+
+            # Chain on the last judged best; until the batch is scored, carry
+            # the previous winner (or this iteration's first candidate).
+            best_q = last_best_q or questions[0]
 
             # update seed = best question to “ask better next time”
             current_seed = (
@@ -281,6 +358,8 @@ def main():
             with open(last_prompt_path, "w", encoding="utf-8") as f:
                 f.write(current_seed)
 
+            log.flush()
+
         plog(log, "done", outdir=outdir)
         print(f"[{now_iso()}] Done. Results in: {outdir}")
         print(f"  - Log: {log_path}")
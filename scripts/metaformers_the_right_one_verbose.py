@@ -6,20 +6,44 @@ macOS-friendly builders that try to discover *the right prompts* and execute
 local build steps. Uses Ollama models for Questioner/Creator/Mediator.
 """
 
+import asyncio
+import functools
 import os
+import re
+import selectors
 import sys
 import time
 import shlex
 import subprocess
 import json
+from dataclasses import dataclass
 from datetime import datetime, timezone
-from threading import Thread, Event
+from threading import Event
 from typing import Optional, Tuple, List, Dict
 
+try:
+    import requests
+except Exception:
+    print("[fatal] This script requires `requests` (pip install requests).", file=sys.stderr)
+    sys.exit(3)
+
+try:
+    import ahocorasick  # optional: single-pass blacklist matching
+except Exception:
+    ahocorasick = None
+
 # ==========================
 # Global config (env override)
 # ==========================
-OLLAMA_BIN: str = os.environ.get("OLLAMA_BIN", "/usr/local/bin/ollama")
+OLLAMA_HOST: str = os.environ.get("OLLAMA_HOST", "http://127.0.0.1:11434")
+
+# Server-side batching knobs: three different models are in play, so the
+# server should keep all of them loaded and batch concurrent calls. These
+# only take effect if the Ollama server is launched from this environment;
+# they are logged in the startup banner either way.
+os.environ.setdefault("OLLAMA_NUM_PARALLEL", "4")
+os.environ.setdefault("OLLAMA_MAX_LOADED_MODELS", "3")
+os.environ.setdefault("OLLAMA_KEEP_ALIVE", "-1")
 AI_QUESTIONER: str = os.environ.get("AI_QUESTIONER", "llama2-uncensored:latest")
 AI_CREATOR: str    = os.environ.get("AI_CREATOR",    "gpt-oss:20b")
 AI_MEDIATOR: str   = os.environ.get("AI_MEDIATOR",   "dolphin3:latest")
@@ -37,6 +61,14 @@ CREATOR_OLLAMA_OPTS: Dict[str, str] = {
     "num_ctx": os.environ.get("CREATOR_NUM_CTX", "4096"),
 }
 
+# Mediator answers in ≤40 words, so a small context window and a tight
+# prediction cap keep its forward pass cheap.
+MEDIATOR_OLLAMA_OPTS: Dict[str, str] = {
+    "num_ctx": "2048",
+    "num_predict": "96",
+    "temperature": "0.3",
+}
+
 ROOT: str = os.getcwd()
 RUNS_DIR: str = os.path.join(ROOT, "runs")
 LOCAL_META_DIR: str = os.path.join(ROOT, "local-meta")
@@ -44,6 +76,8 @@ os.makedirs(RUNS_DIR, exist_ok=True)
 os.makedirs(LOCAL_META_DIR, exist_ok=True)
 
 # ========== COLORS ==========
+# Colors are dropped entirely when stdout is not a terminal (piped/logged runs).
+_IS_TTY = sys.stdout.isatty()
 C = {
     "ts": "\033[38;5;245m",
     "ok": "\033[38;5;42m",
@@ -55,31 +89,50 @@ C = {
     "model": "\033[38;5;207m",
     "reset": "\033[0m",
 }
+if not _IS_TTY:
+    C = {k: "" for k in C}
+
+# Per-level prefixes/suffix are assembled once; log_* only concatenates.
+_RESET = C["reset"]
+_TS_OPEN = C["ts"] + "["
+_TS_CLOSE = "] " + _RESET
+_TS_CACHE: List = [0, ""]  # [whole second, rendered timestamp]
 
 def _ts() -> str:
-    """Return an ISO8601 UTC timestamp with ANSI color."""
-    return f"{C['ts']}[{datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')}] {C['reset']}"
+    """Return an ISO8601 UTC timestamp with ANSI color (cached per second)."""
+    t = int(time.time())
+    if _TS_CACHE[0] != t:
+        _TS_CACHE[0] = t
+        _TS_CACHE[1] = (
+            _TS_OPEN
+            + datetime.fromtimestamp(t, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+            + _TS_CLOSE
+        )
+    return _TS_CACHE[1]
+
+def _emit(prefix: str, msg: str) -> None:
+    sys.stdout.write(_ts() + prefix + msg + _RESET + "\n")
 
 def log_info(msg: str) -> None:
-    print(f"{_ts()}{C['info']}{msg}{C['reset']}")
+    _emit(C["info"], msg)
 
 def log_ok(msg: str) -> None:
-    print(f"{_ts()}{C['ok']}{msg}{C['reset']}")
+    _emit(C["ok"], msg)
 
 def log_warn(msg: str) -> None:
-    print(f"{_ts()}{C['warn']}{msg}{C['reset']}")
+    _emit(C["warn"], msg)
 
 def log_err(msg: str) -> None:
-    print(f"{_ts()}{C['err']}{msg}{C['reset']}")
+    _emit(C["err"], msg)
 
 def log_model(msg: str) -> None:
-    print(f"{_ts()}{C['model']}{msg}{C['reset']}")
+    _emit(C["model"], msg)
 
 def log_cmd(msg: str) -> None:
-    print(f"{_ts()}{C['cmd']}{msg}{C['reset']}")
+    _emit(C["cmd"], msg)
 
 def log_write(pth: str) -> None:
-    print(f"{_ts()}{C['write']}[write] {pth}{C['reset']}")
+    _emit(C["write"], f"[write] {pth}")
 
 
 # ========== SAFETY: COMMAND BLACKLIST ==========
@@ -95,18 +148,39 @@ BLACKLIST_SUBSTR: List[str] = [
     "curl | sh", "wget | sh",
 ]
 
+# One automaton (or one fused regex) matches every pattern in a single pass
+# over the command instead of one `in` scan per pattern.
+if ahocorasick is not None:
+    _BL_AC = ahocorasick.Automaton()
+    for _w in BLACKLIST_SUBSTR:
+        _BL_AC.add_word(_w, _w)
+    _BL_AC.make_automaton()
+    _BL_RE = None
+else:
+    _BL_AC = None
+    _BL_RE = re.compile("|".join(map(re.escape, BLACKLIST_SUBSTR)))
+
 def is_blacklisted(cmd: str) -> Optional[str]:
     """
     Return a matched blacklisted substring if the command is unsafe; otherwise None.
     """
     low = " " + cmd.strip().lower() + " "
-    for bad in BLACKLIST_SUBSTR:
-        if bad in low:
+    if _BL_AC is not None:
+        for _, bad in _BL_AC.iter(low):
             return bad.strip()
-    return None
+        return None
+    m = _BL_RE.search(low)
+    return m.group(0).strip() if m else None
 
 
 # ========== SHELL EXEC ==========
+# Raw byte stream for command/model echo: one write per chunk read, no
+# per-line text-mode encode. Timestamped lines still go through log_*.
+_OUT = sys.stdout.buffer
+
+# Shell metacharacters that require /bin/sh; plain argv commands exec directly.
+_META = re.compile(r"[|&;<>()$`\\\"'*?~{}]")
+
 def run_shell(command: str, timeout: int = 300) -> Tuple[bool, str, str, int]:
     """
     Run a shell command with streaming stdout/stderr and timeout.
@@ -122,190 +196,343 @@ def run_shell(command: str, timeout: int = 300) -> Tuple[bool, str, str, int]:
         log_err(f"[blocked] command contains blacklisted pattern: {bad}")
         return False, "", f"blocked: {bad}", 127
 
-    proc = subprocess.Popen(
-        command, shell=True,
-        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, bufsize=1
-    )
-    start = time.time()
-    out_lines: List[str] = []
-    err_lines: List[str] = []
+    # Commands without shell metacharacters (the common '/bin/echo ok' case)
+    # skip the intermediate /bin/sh fork+exec.
+    argv: Optional[List[str]] = None
+    if not _META.search(command):
+        try:
+            argv = shlex.split(command) or None
+        except ValueError:
+            argv = None
+        # Leading env assignments (FOO=bar cmd) are shell syntax, not an
+        # executable — route those through /bin/sh like before.
+        if argv and "=" in argv[0]:
+            argv = None
     try:
-        while True:
-            if proc.poll() is not None:
-                break
-            line = proc.stdout.readline()
-            if line:
-                print(line.rstrip())
-                out_lines.append(line)
-            eline = proc.stderr.readline()
-            if eline:
-                print(f"[STDERR] {eline.rstrip()}")
-                err_lines.append(eline)
-            if time.time() - start > timeout:
+        if argv:
+            proc = subprocess.Popen(
+                argv,
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE
+            )
+        else:
+            proc = subprocess.Popen(
+                command, shell=True,
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE
+            )
+    except OSError as e:
+        log_err(f"[spawn-failed] {e}")
+        return False, "", str(e), 127
+    # Event-driven reads instead of alternating blocking readline() + 10 ms
+    # sleeps: both pipes are non-blocking and drained in 64 KiB chunks (the
+    # Linux pipe buffer size) the moment either has data.
+    sel = selectors.DefaultSelector()
+    os.set_blocking(proc.stdout.fileno(), False)
+    os.set_blocking(proc.stderr.fileno(), False)
+    sel.register(proc.stdout, selectors.EVENT_READ, "out")
+    sel.register(proc.stderr, selectors.EVENT_READ, "err")
+
+    # Watch the child itself in the same selector (Linux 5.3+): the pidfd
+    # becomes readable on exit, so the deadline also covers a child that
+    # closed its pipes but keeps running. Elsewhere proc.wait() after EOF
+    # remains the fallback.
+    pidfd = -1
+    if hasattr(os, "pidfd_open"):
+        try:
+            pidfd = os.pidfd_open(proc.pid)
+            sel.register(pidfd, selectors.EVENT_READ, "exit")
+        except OSError:
+            pidfd = -1
+
+    deadline = time.monotonic() + timeout
+    out_buf = bytearray()
+    err_buf = bytearray()
+    open_streams = 2
+    timed_out = False
+    exited = False
+    try:
+        while open_streams or (pidfd >= 0 and not exited):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
                 proc.kill()
-                return False, "".join(out_lines), "".join(err_lines), 124
-            time.sleep(0.01)
+                timed_out = True
+                break
+            echoed = False
+            for key, _ in sel.select(timeout=min(remaining, 1.0)):
+                if key.data == "exit":
+                    # Peek the status without reaping; proc.wait() below reaps.
+                    os.waitid(os.P_PIDFD, key.fileobj, os.WEXITED | os.WNOWAIT)
+                    sel.unregister(key.fileobj)
+                    exited = True
+                    continue
+                data = os.read(key.fileobj.fileno(), 65536)
+                if not data:
+                    sel.unregister(key.fileobj)
+                    open_streams -= 1
+                    continue
+                if key.data == "out":
+                    out_buf += data
+                    # Echo the raw chunk in one write; flush once per wakeup.
+                    _OUT.write(data)
+                    echoed = True
+                else:
+                    err_buf += data
+                    for ln in data.decode("utf-8", "replace").splitlines():
+                        print(f"[STDERR] {ln}")
+            if echoed:
+                _OUT.flush()
     finally:
-        try:
-            rest_out, rest_err = proc.communicate(timeout=0.2)
-        except Exception:
-            rest_out, rest_err = ("", "")
-        if rest_out:
-            out_lines.append(rest_out)
-        if rest_err:
-            err_lines.append(rest_err)
-
-    rc = proc.returncode or 0
+        sel.close()
+        if pidfd >= 0:
+            try:
+                os.close(pidfd)
+            except OSError:
+                pass
+
+    out = out_buf.decode("utf-8", "replace")
+    err = err_buf.decode("utf-8", "replace")
+    if timed_out:
+        # Reap the SIGKILLed child (returns promptly) so timed-out commands
+        # don't pile up as zombies across this long-running loop.
+        proc.wait()
+        return False, out, err, 124
+
+    rc = proc.wait() or 0
     ok = (rc == 0)
     if ok:
         log_ok(f"[exit {rc}]")
     else:
         log_err(f"[exit {rc}]")
-    return ok, "".join(out_lines), "".join(err_lines), rc
+    return ok, out, err, rc
 
 
-def _timer_countdown(seconds: int, stop: Event) -> None:
+async def run_shell_batch(cmds: List[str], timeout: int = 300) -> None:
     """
-    Print a live countdown like '⏳ 30s' once per second on the same line,
-    until seconds elapse or the stop event is set.
+    Run independent plan commands concurrently, bounded by CPU count.
+    Output is buffered per command and logged on completion so concurrent
+    streams don't interleave; a single command keeps run_shell's live echo.
     """
-    if seconds <= 0:
+    if len(cmds) == 1:
+        run_shell(cmds[0], timeout=timeout)
         return
-    for s in range(seconds, 0, -1):
-        if stop.is_set():
-            break
-        print(f"\r⏳ {s:02d}s ", end="", flush=True)
-        time.sleep(1)
-    # Clear the line end when done
-    print("\r", end="", flush=True)
+
+    sem = asyncio.Semaphore(os.cpu_count() or 2)
+
+    async def _run(cmd: str) -> None:
+        async with sem:
+            bad = is_blacklisted(cmd)
+            if bad:
+                log_err(f"[blocked] command contains blacklisted pattern: {bad}")
+                return
+            log_cmd(f"$ {cmd}")
+            if not REAL_OPS:
+                log_warn("[dry-run] skipped")
+                return
+            try:
+                proc = await asyncio.create_subprocess_shell(
+                    cmd,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE,
+                )
+            except OSError as e:
+                log_err(f"[spawn-failed] {e}")
+                return
+            try:
+                out_b, err_b = await asyncio.wait_for(proc.communicate(), timeout=timeout)
+            except asyncio.TimeoutError:
+                proc.kill()
+                await proc.communicate()
+                log_err(f"[timeout] {cmd}")
+                return
+            out = out_b.decode("utf-8", "replace")
+            if out:
+                print(out, end="" if out.endswith("\n") else "\n", flush=True)
+            for ln in err_b.decode("utf-8", "replace").splitlines():
+                print(f"[STDERR] {ln}")
+            rc = proc.returncode or 0
+            (log_ok if rc == 0 else log_err)(f"[exit {rc}] {cmd}")
+
+    await asyncio.gather(*(_run(c) for c in cmds))
+
 
 # ========== OLLAMA ==========
+# One shared session: the loopback connection is reused across every model
+# call instead of paying fork/exec + pipe plumbing per `ollama run`. The
+# adapter keeps up to OLLAMA_NUM_PARALLEL sockets alive so the prefetched
+# Questioner, the Creator, and detached Mediator calls each reuse a warm
+# connection instead of handshaking per request.
+SESSION = requests.Session()
+SESSION.mount(
+    "http://",
+    requests.adapters.HTTPAdapter(
+        pool_connections=8,
+        pool_maxsize=max(8, int(os.environ.get("OLLAMA_NUM_PARALLEL", "4"))),
+    ),
+)
+# Request-side keep_alive. OLLAMA_KEEP_ALIVE defaults to unit-less "-1"
+# above (server-side pin-forever), but as a JSON *string* Ollama parses it
+# with ParseDuration and rejects it, 400ing every call — numeric values must
+# go out as typed numbers (like _warm_ping's integer -1); duration strings
+# such as "30m"/"24h" pass through unchanged.
+_KA_RAW = os.environ.get("OLLAMA_KEEP_ALIVE", "30m")
+try:
+    KEEP_ALIVE = int(_KA_RAW)
+except ValueError:
+    KEEP_ALIVE = _KA_RAW
+
+# Bound concurrent generations to what the server is configured to batch.
+_SEM = asyncio.Semaphore(int(os.environ.get("OLLAMA_NUM_PARALLEL", "4")))
+
 def have_ollama() -> bool:
-    """Check if ollama binary exists and is executable."""
-    return os.path.exists(OLLAMA_BIN) and os.access(OLLAMA_BIN, os.X_OK)
+    """Check if the Ollama server answers on OLLAMA_HOST."""
+    try:
+        return SESSION.get(OLLAMA_HOST, timeout=5).ok
+    except requests.RequestException:
+        return False
+
+def _coerce_opts(options: Dict[str, str]) -> Dict[str, object]:
+    """The HTTP API wants typed option values; env-sourced ones are strings."""
+    out: Dict[str, object] = {}
+    for k, v in options.items():
+        try:
+            out[k] = int(v)
+        except (TypeError, ValueError):
+            try:
+                out[k] = float(v)
+            except (TypeError, ValueError):
+                out[k] = v
+    return out
 
-def ollama_run(model: str, prompt: str, timeout: int = TIMEOUT_SECS, think_secs: int = 0, options: Optional[Dict[str, str]] = None) -> str:
+def ollama_run(model: str, prompt: str, timeout: int = TIMEOUT_SECS, first_evt: Optional[Event] = None, options: Optional[Dict[str, str]] = None) -> str:
     """
-    Run an Ollama model with the given prompt; stream output for verbosity.
-    Optional 'options' maps to '-o key=value' pairs.
-    The visible countdown (if any) stops immediately upon receiving the first token.
+    Generate via POST /api/generate with streaming; echoes tokens for verbosity.
+    `first_evt` (if given) is set as soon as the first token arrives so the
+    caller can stop rendering its countdown.
     """
-    if not have_ollama():
-        log_err(f"Ollama not found at: {OLLAMA_BIN}")
-        return ""
     log_model(f"[{model}] <<<")
     log_info("Streaming model output…")
 
-    cmd = [OLLAMA_BIN, "run"]
+    payload = {"model": model, "prompt": prompt, "stream": True, "keep_alive": KEEP_ALIVE}
     if options:
-        for k, v in options.items():
-            cmd += ["-o", f"{k}={v}"]
-    cmd += [model]
+        payload["options"] = _coerce_opts(options)
 
-    try:
-        proc = subprocess.Popen(
-            cmd,
-            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-            text=True, bufsize=1
-        )
-    except Exception as e:
-        log_err(f"Ollama launch failed: {e}")
-        return ""
-
-    # Send prompt
-    try:
-        proc.stdin.write(prompt)
-        proc.stdin.flush()
-        proc.stdin.close()
-    except Exception:
-        pass
-
-    # Start a live timer while the model is thinking; stop on first token
-    stop_evt = Event()
-    timer_thread = None
-    if think_secs and think_secs > 0:
-        timer_thread = Thread(target=_timer_countdown, args=(think_secs, stop_evt), daemon=True)
-        timer_thread.start()
-
-    start = time.time()
     chunks: List[str] = []
     first_token = False
 
     try:
-        while True:
-            if proc.poll() is not None:
-                break
-
-            line = proc.stdout.readline()
-            if line:
+        r = SESSION.post(f"{OLLAMA_HOST}/api/generate", json=payload, stream=True, timeout=timeout)
+        r.raise_for_status()
+        # 64 KiB reads: drains token bursts from the server in one syscall
+        # instead of trickling through small socket reads.
+        for line in r.iter_lines(chunk_size=65536):
+            if not line:
+                continue
+            piece = json.loads(line)
+            tok = piece.get("response", "")
+            if tok:
                 if not first_token:
                     first_token = True
-                    stop_evt.set()
+                    if first_evt is not None:
+                        first_evt.set()
                     print("\r", end="", flush=True)
                     log_info("[creator] first token received.")
-                print(line.rstrip())
-                chunks.append(line)
-
-            el = proc.stderr.readline()
-            if el:
-                if not first_token:
-                    first_token = True
-                    stop_evt.set()
-                    print("\r", end="", flush=True)
-                    log_info("[creator] first token (stderr) received.")
-                print(f"[STDERR] {el.rstrip()}")
-
-            if time.time() - start > timeout:
-                proc.kill()
-                log_err("[timeout] ollama exceeded")
+                _OUT.write(tok.encode("utf-8"))
+                _OUT.flush()
+                chunks.append(tok)
+            if piece.get("done"):
                 break
-
-            time.sleep(0.01)
+        if chunks:
+            print()
+    except requests.Timeout:
+        log_err("[timeout] ollama exceeded")
+    except (requests.RequestException, ValueError) as e:
+        log_err(f"Ollama request failed: {e}")
     finally:
-        try:
-            rest, rest_err = proc.communicate(timeout=0.2)
-        except Exception:
-            rest, rest_err = ("", "")
-        if rest:
-            print(rest.rstrip())
-            chunks.append(rest)
-        if rest_err:
-            print(f"[STDERR] {rest_err.rstrip()}")
-
-        try:
-            stop_evt.set()
-        except Exception:
-            pass
-        if timer_thread is not None:
-            try:
-                timer_thread.join(timeout=0.2)
-            except Exception:
-                pass
+        if first_evt is not None:
+            first_evt.set()
 
     return "".join(chunks)
 
+async def acall_ollama(model: str, prompt: str, timeout: int = TIMEOUT_SECS, think_secs: int = 0, options: Optional[Dict[str, str]] = None) -> str:
+    """
+    Async wrapper: runs ollama_run in a worker thread under the parallel bound.
+    The first-token countdown is rendered here off the event-loop timer — no
+    dedicated countdown thread spawned and torn down per call.
+    """
+    async with _SEM:
+        first_evt = Event()
+        task = asyncio.create_task(
+            asyncio.to_thread(ollama_run, model, prompt, timeout, first_evt, options)
+        )
+        if think_secs and think_secs > 0:
+            deadline = time.monotonic() + think_secs
+            while not first_evt.is_set() and not task.done():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                print(f"\r⏳ {int(remaining):02d}s ", end="", flush=True)
+                await asyncio.sleep(min(1.0, remaining))
+            print("\r", end="", flush=True)
+        return await task
+
+def _warm_ping(model: str) -> None:
+    """Empty-prompt generate: loads the weights and pins them (keep_alive -1)."""
+    try:
+        SESSION.post(
+            f"{OLLAMA_HOST}/api/generate",
+            json={"model": model, "prompt": "", "stream": False, "keep_alive": -1},
+            timeout=300,
+        )
+    except requests.RequestException as e:
+        log_warn(f"[warmup] {model}: {e}")
+
+async def _warmup() -> None:
+    """Pin all three role models concurrently so no iteration pays a model swap."""
+    models = list(dict.fromkeys((AI_QUESTIONER, AI_CREATOR, AI_MEDIATOR)))
+    await asyncio.gather(*(asyncio.to_thread(_warm_ping, m) for m in models))
+
 
 # ========== Parsing utilities ==========
+@dataclass(slots=True)
+class PlanFile:
+    """One file entry from a Creator plan. Slots beat per-entry dicts on both
+    memory and attribute access; paths are interned since prefixes repeat."""
+    path: str
+    content: str
+
+@functools.lru_cache(maxsize=8)
+def _section_spans(text: str) -> Dict[str, str]:
+    """
+    Single pass over a plan: map each lowercased '## ' header to its section
+    body (text until the next '## ' line or EOF). Memoized so parse_topic /
+    parse_files / parse_commands split the same plan only once.
+    """
+    lines = text.splitlines()
+    spans: Dict[str, str] = {}
+    open_secs: List[Tuple[str, int]] = []  # (header key, body start index)
+    for i, ln in enumerate(lines):
+        if ln.startswith("## "):
+            still_open: List[Tuple[str, int]] = []
+            for key, start in open_secs:
+                if i > start:
+                    spans.setdefault(key, "\n".join(lines[start:i]).strip())
+                else:
+                    still_open.append((key, start))
+            open_secs = still_open
+        s = ln.strip().lower()
+        if s.startswith("## "):
+            key = s[3:]
+            if key and key not in spans and all(k != key for k, _ in open_secs):
+                open_secs.append((key, i + 1))
+    for key, start in open_secs:
+        spans.setdefault(key, "\n".join(lines[start:]).strip())
+    return spans
+
 def _section(text: str, header: str) -> str:
     """
     Return the text under a markdown '## {header}' section until the next '## ' or EOF.
     Case-insensitive match on header.
     """
-    lines = text.splitlines()
-    start = -1
-    target = f"## {header}".lower()
-    for i, ln in enumerate(lines):
-        if ln.strip().lower() == target:
-            start = i + 1
-            break
-    if start == -1:
-        return ""
-    buf: List[str] = []
-    for j in range(start, len(lines)):
-        if j > start and lines[j].startswith("## "):
-            break
-        buf.append(lines[j])
-    return "\n".join(buf).strip()
+    return _section_spans(text).get(header.lower(), "")
 
 def parse_topic(plan: str) -> str:
     """
@@ -322,9 +549,25 @@ def parse_topic(plan: str) -> str:
             return s
     return ""
 
-def parse_files(plan: str) -> List[Dict[str, str]]:
+# One compiled scan enumerates all fenced blocks (header + body) instead of
+# walking the plan line by line in Python.
+_FENCE_RE = re.compile(r"^```(?P<hdr>[^\n`]*)\r?\n(?P<body>.*?)^```", re.M | re.S)
+_LIST_RE = re.compile(r"^\s*-+\s*(.+?)\s*$", re.M)
+
+def _hdr_to_path(hdr: str) -> str:
+    """Map a fence header ('path=...', './local-meta/...', 'file: ...') to a path."""
+    hdr = hdr.strip()
+    if "path=" in hdr:
+        return hdr.split("path=", 1)[1].strip()
+    if hdr.startswith("./local-meta/"):
+        return hdr
+    if hdr.lower().startswith("file:"):
+        return hdr.split(":", 1)[1].strip()
+    return ""
+
+def parse_files(plan: str) -> List[PlanFile]:
     """
-    Returns a list of dicts: [{"path": "./local-meta/...", "content": "..."}]
+    Returns PlanFile entries, e.g. PlanFile("./local-meta/...", "...").
     Recognizes:
       - list lines: "- ./local-meta/path : purpose"
       - fenced blocks:
@@ -342,47 +585,23 @@ def parse_files(plan: str) -> List[Dict[str, str]]:
     files: Dict[str, str] = {}
 
     # list lines
-    for ln in _section(plan, "Files").splitlines():
-        s = ln.strip()
-        if not s or s.startswith("|"):
-            continue
-        if s.startswith("-"):
-            body = s.lstrip("-").strip()
-            if body.startswith("./"):
-                pth = body.split(":", 1)[0].strip()
-                files.setdefault(pth, "")
+    for m in _LIST_RE.finditer(_section(plan, "Files")):
+        body = m.group(1)
+        if body.startswith("./"):
+            pth = body.split(":", 1)[0].strip()
+            files.setdefault(pth, "")
 
     # fenced blocks with various headers
-    lines = plan.splitlines()
-    i = 0
-    while i < len(lines):
-        ln = lines[i].rstrip()
-        if ln.startswith("```"):
-            hdr = ln.strip("`").strip()
-            pth = ""
-            if "path=" in hdr:
-                try:
-                    _, path_part = hdr.split("path=", 1)
-                    pth = path_part.strip()
-                except ValueError:
-                    pth = ""
-            elif hdr.startswith("./local-meta/"):
-                pth = hdr
-            elif hdr.lower().startswith("file:"):
-                pth = hdr.split(":", 1)[1].strip()
-            i += 1
-            buf: List[str] = []
-            while i < len(lines) and not lines[i].startswith("```"):
-                buf.append(lines[i])
-                i += 1
-            if pth:
-                files[pth] = "\n".join(buf)
-        i += 1
-
-    out: List[Dict[str, str]] = []
+    for m in _FENCE_RE.finditer(plan):
+        pth = _hdr_to_path(m.group("hdr"))
+        if pth:
+            body = m.group("body")
+            files[pth] = body[:-1] if body.endswith("\n") else body
+
+    out: List[PlanFile] = []
     for pth, content in files.items():
         if pth:
-            out.append({"path": pth, "content": content})
+            out.append(PlanFile(sys.intern(pth), content))
     return out
 
 def parse_commands(plan: str) -> List[str]:
@@ -393,62 +612,134 @@ def parse_commands(plan: str) -> List[str]:
     """
     sec = _section(plan, "Commands")
     cmds: List[str] = []
-    for ln in sec.splitlines():
-        s = ln.strip()
-        if not s:
-            continue
-        if s.startswith("-"):
-            s = s.lstrip("-").strip()
-            if s and not s.startswith("#"):
-                cmds.append(s)
+    for m in _LIST_RE.finditer(sec):
+        s = m.group(1)
+        if s and not s.startswith("#"):
+            cmds.append(s)
     # fenced code (accept bash, sh, or unlabeled)
-    lines = sec.splitlines()
-    i = 0
-    while i < len(lines):
-        ln = lines[i].strip()
-        if ln.startswith("```"):
-            label = ln.strip("`").strip().lower()
-            if ("bash" in label) or ("sh" in label) or (label == ""):
-                i += 1
-                buf: List[str] = []
-                while i < len(lines) and not lines[i].strip().startswith("```"):
-                    if lines[i].strip() and not lines[i].strip().startswith("#"):
-                        buf.append(lines[i])
-                    i += 1
-                for c in buf:
-                    c = c.strip()
-                    if c:
-                        cmds.append(c)
-        i += 1
+    for m in _FENCE_RE.finditer(sec):
+        label = m.group("hdr").strip().lower()
+        if ("bash" in label) or ("sh" in label) or (label == ""):
+            for c in m.group("body").splitlines():
+                c = c.strip()
+                if c and not c.startswith("#"):
+                    cmds.append(c)
     return cmds
 
 
 # ========== File operations ==========
-def safe_write_file(repo_root: str, rel_or_abs: str, content: str) -> bool:
+# The root's realpath never changes at runtime, and plan files cluster in a
+# handful of directories — resolving each parent once avoids the O(depth)
+# readlink walk per written file.
+_ROOT_REAL = os.path.realpath(ROOT)
+
+@functools.lru_cache(maxsize=1024)
+def _resolve_parent(d: str) -> str:
+    return os.path.realpath(d)
+
+def resolve_in_repo(repo_root: str, rel_or_abs: str) -> str:
     """
-    Safely write a file inside the repository root. Returns True on success.
+    Resolve a plan path against the repository root. Returns the real absolute
+    path, or "" (with a log line) if it escapes the root.
     """
     pth = rel_or_abs
     if pth.startswith("./"):
         pth = os.path.join(repo_root, pth[2:])
     elif not os.path.isabs(pth):
         pth = os.path.join(repo_root, pth)
-    pth = os.path.realpath(pth)
-    root_real = os.path.realpath(repo_root)
-    if not pth.startswith(root_real + os.sep):
+    parent_real = _resolve_parent(os.path.dirname(pth))
+    pth = os.path.join(parent_real, os.path.basename(pth))
+    root_real = _ROOT_REAL if repo_root == ROOT else os.path.realpath(repo_root)
+    try:
+        contained = os.path.commonpath([parent_real, root_real]) == root_real
+    except ValueError:
+        contained = False
+    if not contained:
         log_err(f"[write-blocked] path escapes repo: {pth}")
+        return ""
+    return pth
+
+def safe_write_file(repo_root: str, rel_or_abs: str, content: str, ensure_parent: bool = True) -> bool:
+    """
+    Safely write a file inside the repository root. Returns True on success.
+    Writes go to '<path>.tmp' and are moved into place with os.replace, so a
+    crash mid-write never leaves a torn file. Callers that already created the
+    parent directories (the batched apply loop) pass ensure_parent=False.
+    """
+    pth = resolve_in_repo(repo_root, rel_or_abs)
+    if not pth:
         return False
-    os.makedirs(os.path.dirname(pth), exist_ok=True)
+    if ensure_parent:
+        os.makedirs(os.path.dirname(pth), exist_ok=True)
+    tmp = pth + ".tmp"
     try:
-        with open(pth, "w", encoding="utf-8") as f:
-            f.write(content)
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.write(fd, memoryview(content.encode("utf-8")))
+        finally:
+            os.close(fd)
+        os.replace(tmp, pth)
         log_write(pth)
+        _invalidate_tree_size(pth)
         return True
     except Exception as e:
         log_err(f"[write-failed] {pth}: {e}")
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
         return False
 
 
+# ========== Disk usage (in-process, cached) ==========
+_TREE_SIZE_CACHE: Dict[str, int] = {}
+
+def _tree_size(path: str) -> int:
+    """
+    Recursive on-disk size of a directory via os.scandir, cached per realpath.
+    Unchanged subtrees are served from the cache; safe_write_file invalidates
+    the ancestors of every path it writes.
+    """
+    real = os.path.realpath(path)
+    cached = _TREE_SIZE_CACHE.get(real)
+    if cached is not None:
+        return cached
+    total = 0
+    try:
+        with os.scandir(real) as entries:
+            for e in entries:
+                try:
+                    if e.is_dir(follow_symlinks=False):
+                        total += _tree_size(e.path)
+                    else:
+                        total += e.stat(follow_symlinks=False).st_size
+                except OSError:
+                    continue
+    except OSError:
+        return 0
+    _TREE_SIZE_CACHE[real] = total
+    return total
+
+def _invalidate_tree_size(file_path: str) -> None:
+    """Drop cached sizes for every ancestor directory of a written file."""
+    d = os.path.dirname(os.path.realpath(file_path))
+    while d:
+        _TREE_SIZE_CACHE.pop(d, None)
+        parent = os.path.dirname(d)
+        if parent == d:
+            break
+        d = parent
+
+def _human_size(n: int) -> str:
+    """Format bytes the way `du -sh` does (e.g. 512B, 4.0K, 1.2M)."""
+    size = float(n)
+    for unit in ("B", "K", "M", "G", "T"):
+        if size < 1024.0 or unit == "T":
+            return f"{int(size)}{unit}" if unit == "B" else f"{size:.1f}{unit}"
+        size /= 1024.0
+    return f"{size:.1f}P"
+
+
 RIGHT_PROMPT_SEED = (
     "You are the Questioner in a three‑AI loop that is searching for THE RIGHT PROMPTS to make a local, offline LLM (Ollama + Python + Postgres on macOS) build and improve itself. "
     "Propose ONE sharp, technical research question (single sentence ending with '?') that, if answered, would lead to an executable plan with concrete files and commands. "
@@ -488,30 +779,36 @@ def prompt_creator(topic: str) -> str:
         "Example:\n"
         "{\"files\":[{\"path\":\"./local-meta/hello.txt\",\"content\":\"hello from builders\"}],\"commands\":[\"/bin/echo ok\"]}\n"
     )
-def parse_creator_json(s: str) -> Tuple[List[Dict[str, str]], List[str]]:
+_JSON_DECODER = json.JSONDecoder()
+
+def parse_creator_json(s: str) -> Tuple[List[PlanFile], List[str]]:
     """
     Try to parse a JSON plan into (files, commands).
-    Accepts the first brace-to-brace JSON object found if extra junk surrounds it.
+    Scans for the first decodable JSON object when extra junk surrounds it,
+    so prose before/after or stray braces inside don't lose the plan.
     """
     s = s.strip()
-    try:
-        obj = json.loads(s)
-        return obj.get("files", []) or [], obj.get("commands", []) or []
-    except Exception:
-        pass
-    start = s.find("{")
-    end = s.rfind("}")
-    if start != -1 and end != -1 and end > start:
-        chunk = s[start:end+1]
-        try:
-            obj = json.loads(chunk)
-            return obj.get("files", []) or [], obj.get("commands", []) or []
-        except Exception:
+    pos = 0
+    while True:
+        start = s.find("{", pos)
+        if start == -1:
             return [], []
-    return [], []
-
-def fallback_json_plan(topic: str) -> Tuple[List[Dict[str, str]], List[str]]:
-    files = [{"path": "./local-meta/hello.txt", "content": "hello from builders"}]
+        try:
+            obj, _ = _JSON_DECODER.raw_decode(s, start)
+        except ValueError:
+            pos = start + 1
+            continue
+        if isinstance(obj, dict):
+            files = [
+                PlanFile(sys.intern(str(d.get("path", ""))), str(d.get("content", "")))
+                for d in (obj.get("files", []) or [])
+                if isinstance(d, dict) and d.get("path")
+            ]
+            return files, obj.get("commands", []) or []
+        pos = start + 1
+
+def fallback_json_plan(topic: str) -> Tuple[List[PlanFile], List[str]]:
+    files = [PlanFile("./local-meta/hello.txt", "hello from builders")]
     cmds  = ["/bin/echo ok"]
     return files, cmds
 
@@ -528,14 +825,29 @@ def prompt_mediator(plan: str) -> str:
 
 
 # ========== Main control loop ==========
-def main() -> None:
+async def main() -> None:
+    log_info(
+        "Ollama batching: "
+        f"OLLAMA_NUM_PARALLEL={os.environ['OLLAMA_NUM_PARALLEL']} "
+        f"OLLAMA_MAX_LOADED_MODELS={os.environ['OLLAMA_MAX_LOADED_MODELS']} "
+        f"OLLAMA_KEEP_ALIVE={os.environ['OLLAMA_KEEP_ALIVE']}"
+    )
+    log_info("Warming and pinning models…")
+    await _warmup()
+
     prev_topic: str = ""
+    # Questioner runs one iteration ahead: the task awaited at the top of each
+    # iteration was scheduled during the previous one, so it overlaps with the
+    # Creator generation. Mediator calls run off the critical path entirely.
+    next_topic_task = asyncio.create_task(
+        acall_ollama(AI_QUESTIONER, prompt_questioner(prev_topic), timeout=TIMEOUT_SECS)
+    )
+    mediator_tasks: List[asyncio.Task] = []
     for it in range(1, ITERATIONS + 1):
         log_info(f"=== Iteration {it}/{ITERATIONS} ===")
 
-        # 1) Questioner proposes a topic
-        q_prompt = prompt_questioner(prev_topic)
-        topic_out = ollama_run(AI_QUESTIONER, q_prompt, timeout=TIMEOUT_SECS).strip()
+        # 1) Questioner proposes a topic (prefetched last iteration)
+        topic_out = (await next_topic_task).strip()
         topic = topic_out.splitlines()[0].strip() if topic_out else ""
         if topic.startswith('"') and topic.endswith('"') and len(topic) >= 2:
             topic = topic[1:-1].strip()
@@ -544,18 +856,25 @@ def main() -> None:
             topic = prev_topic or "Find the right prompt to bootstrap robust local builds."
         log_model(f"Topic: {topic}")
         prev_topic = topic
+        if it < ITERATIONS:
+            next_topic_task = asyncio.create_task(
+                acall_ollama(AI_QUESTIONER, prompt_questioner(prev_topic), timeout=TIMEOUT_SECS)
+            )
 
         # 2) Creator produces build plan (JSON only)
         c_prompt = prompt_creator(topic)
         log_info(f"[creator] starting generation… (countdown until first token: {CREATOR_THINK_SECS}s)")
-        raw = ollama_run(AI_CREATOR, c_prompt, timeout=TIMEOUT_SECS, think_secs=CREATOR_THINK_SECS, options=CREATOR_OLLAMA_OPTS)
+        raw = await acall_ollama(AI_CREATOR, c_prompt, timeout=TIMEOUT_SECS, think_secs=CREATOR_THINK_SECS, options=CREATOR_OLLAMA_OPTS)
         files, cmds = parse_creator_json(raw)
 
-        # One forced retry if plan is empty or only “Thinking…”
-        if (not files and not cmds) or raw.strip().lower().startswith("thinking"):
+        # One forced retry only if the plan is actually empty; a "Thinking…"
+        # preamble that still yielded a parseable plan is not worth a re-roll.
+        if raw.strip().lower().startswith("thinking") and (files or cmds):
+            log_warn("Creator prefixed 'Thinking…' but the plan parsed; keeping it.")
+        if not files and not cmds:
             log_warn("Creator produced no actionable JSON; retrying with explicit minimal example.")
             c_prompt_retry = c_prompt + "\nRepeat the example JSON above, adjusted for the topic."
-            raw = ollama_run(AI_CREATOR, c_prompt_retry, timeout=TIMEOUT_SECS, think_secs=CREATOR_THINK_SECS, options=CREATOR_OLLAMA_OPTS)
+            raw = await acall_ollama(AI_CREATOR, c_prompt_retry, timeout=TIMEOUT_SECS, think_secs=CREATOR_THINK_SECS, options=CREATOR_OLLAMA_OPTS)
             files, cmds = parse_creator_json(raw)
 
         # Final fallback if still nothing
@@ -563,45 +882,67 @@ def main() -> None:
             log_warn("Creator still empty; applying local JSON fallback plan.")
             files, cmds = fallback_json_plan(topic)
 
-        # 4) Apply files
-        wrote_any = False
+        # 4) Apply files: create each unique parent once, then write atomically
+        to_write: List[Tuple[str, str]] = []
+        parents = set()
         for f in files:
-            pth = f.get("path", "")
+            pth = f.path
             if not pth:
                 continue
-            content = f.get("content", "")
+            content = f.content
             if content.strip() == "":
                 content = f"# Stub created by builders for {pth}\n"
-            wrote_any = safe_write_file(ROOT, pth, content) or wrote_any
+            resolved = resolve_in_repo(ROOT, pth)
+            if not resolved:
+                continue
+            to_write.append((pth, content))
+            parents.add(os.path.dirname(resolved))
+        for d in parents:
+            os.makedirs(d, exist_ok=True)
+        wrote_any = False
+        for pth, content in to_write:
+            wrote_any = safe_write_file(ROOT, pth, content, ensure_parent=False) or wrote_any
         if not wrote_any:
             log_warn("No files written this iteration. (Plan may be incomplete.)")
 
-        # 5) Run commands
+        # 5) Run commands (independent ones execute concurrently)
         if not cmds:
             log_warn("No commands to execute in plan.")
-        for cmd in cmds:
-            run_shell(cmd, timeout=300)
+        else:
+            await run_shell_batch(cmds, timeout=300)
 
-        # 6) Mediator every N
+        # 6) Mediator every N (fire-and-forget; collected after the loop).
+        # Context is the plan's shape (paths + commands), not file contents —
+        # the ≤40-word review doesn't need kilobytes of prompt.
         if it % MEDIATOR_EVERY == 0:
-            m_prompt = prompt_mediator(plan)
-            _ = ollama_run(AI_MEDIATOR, m_prompt, timeout=TIMEOUT_SECS)
-
-        # 7) Disk usage report
-        ok, out, _err, _rc = run_shell(f"du -sh {shlex.quote(LOCAL_META_DIR)} || true", timeout=60)
-        if ok and out:
-            last = out.strip().splitlines()[-1]
-            log_info(f"[disk] {last}")
+            plan_repr = json.dumps(
+                {"files": [f.path for f in files], "commands": cmds}
+            )
+            m_prompt = prompt_mediator(plan_repr)
+            mediator_tasks.append(
+                asyncio.create_task(
+                    acall_ollama(
+                        AI_MEDIATOR, m_prompt, timeout=TIMEOUT_SECS,
+                        options=MEDIATOR_OLLAMA_OPTS,
+                    )
+                )
+            )
+
+        # 7) Disk usage report (in-process; only re-stats subtrees written above)
+        if os.path.isdir(LOCAL_META_DIR):
+            log_info(f"[disk] {_human_size(_tree_size(LOCAL_META_DIR))}\t{LOCAL_META_DIR}")
 
         # small pacing to avoid hot loop if everything is instant
         time.sleep(0.5)
 
+    if mediator_tasks:
+        await asyncio.gather(*mediator_tasks)
     log_ok("Done.")
 
 
 if __name__ == "__main__":
     try:
-        main()
+        asyncio.run(main())
     except KeyboardInterrupt:
         log_warn("Interrupted by user.")
         sys.exit(130)